@@ -24,7 +24,6 @@
             inherit pname version;
             src = ./.;
             propagatedBuildInputs = with pythonPackages; [
-              asciitree
               progressbar2
             ];
           };
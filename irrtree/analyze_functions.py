@@ -1,9 +1,14 @@
-from typing import Dict, Set, FrozenSet, List, Tuple
-from functools import reduce
+from typing import Dict, Set, FrozenSet, List, Tuple, Optional
 import logging
 
-from .process_functions import get_origin_asns
+from .process_functions import (
+    get_origin_asns_per_asset,
+    get_bit,
+    to_bitmask,
+    from_bitmask,
+)
 from .irrtree_parser import ASMembersType, IrrRunData
+from .datamodels import get_as_set_flags
 
 LOGGER = logging.getLogger()
 
@@ -18,43 +23,8 @@ def get_irr_output(
     The as-sets are in the form AS-NAME or ASXYY:AS-NAME
     db is a Dict[str] with two keys members and origin_asns.
     Note: TypeDicts appeared in 3.8 use them for DB
-    The recursive_as_sets folder holds TEMPORAL as-sets which are recursive
-    (something typical in irr), if it returns something it means that a
-    mentioned as-set was not expanded.
     """
-    origin_ases_per_asset: Dict[str, FrozenSet[str]] = {}
-    recursive_as_sets: Dict[str, Set[str]] = {}
-    rp, _ = get_origin_asns(
-        metadata.as_set,
-        origin_ases_per_asset,
-        as_sets_members,
-        parents=[],
-        recursive_as_sets=recursive_as_sets,
-    )
-    assert rp is None, "The parent tree depends on a as-set that is not included"
-    assert (
-        not recursive_as_sets
-    ), "The recursive_as_sets contains unmanaged recursive as_sets"
-    return origin_ases_per_asset
-
-
-def _get_paths_to_autnum(
-    asset: str,
-    members_per_asset: ASMembersType,
-    path: List[str],
-    paths_per_autnum: Dict[str, Set[FrozenSet[str]]],
-):
-    new_path = path + [asset]
-    for member in members_per_asset[asset]:
-        if member in path:
-            continue
-        if "-" in member:
-            _get_paths_to_autnum(member, members_per_asset, new_path, paths_per_autnum)
-        else:
-            # we will remove the root
-            paths_per_autnum.setdefault(member, set()).add(
-                frozenset(x for x in new_path[1:])
-            )
+    return get_origin_asns_per_asset(metadata.as_set, as_sets_members)
 
 
 def get_paths_to_autnum(
@@ -64,9 +34,50 @@ def get_paths_to_autnum(
     Gets the paths per autnum to the root but in terms of sets (to later find
     the common as-sets)
     We remove the root from the path
+    Equal paths are interned, so autnum under the same as-sets share the same
+    path objects.
+    The tree is traversed with an explicit stack, each as-set is pushed twice,
+    once for entering it and once for leaving it (removing it from the path).
     """
+    as_set_flags = get_as_set_flags(members_per_asset)
     paths_per_autnum: Dict[str, Set[FrozenSet[str]]] = {}
-    _get_paths_to_autnum(root_as_set, members_per_asset, [], paths_per_autnum)
+    interned_paths: Dict[FrozenSet[str], FrozenSet[str]] = {}
+    # the as-sets in the path, without the root (which is checked apart)
+    in_path: Set[str] = set()
+    stack: List[Tuple[str, bool]] = [(root_as_set, False)]
+    while stack:
+        asset, leaving = stack.pop()
+        if leaving:
+            in_path.discard(asset)
+            continue
+        if asset in in_path:
+            continue
+        if asset != root_as_set:
+            in_path.add(asset)
+        stack.append((asset, True))
+
+        # all the autnum of this as-set share the same path, built only if
+        # the as-set has autnum
+        this_path: Optional[FrozenSet[str]] = None
+        as_set_members: List[str] = []
+        for member in members_per_asset[asset]:
+            if member == root_as_set or member in in_path:
+                continue
+            if as_set_flags[member]:
+                as_set_members.append(member)
+                continue
+            if this_path is None:
+                this_path = frozenset(in_path)
+                this_path = interned_paths.setdefault(this_path, this_path)
+            # paths are interned and frozensets cache their hash, so adding
+            # an existing path is resolved by identity
+            autnum_paths = paths_per_autnum.get(member)
+            if autnum_paths is None:
+                paths_per_autnum[member] = {this_path}
+            else:
+                autnum_paths.add(this_path)
+        # reversed, so they are visited in the same order as the members
+        stack.extend((member, False) for member in reversed(as_set_members))
     return paths_per_autnum
 
 
@@ -78,64 +89,105 @@ def find_affected_prefixes_estimatino(
     Finds an estimate of affected prefixes if filtered.
     Returns number of affected prefixes and number of autnum
     """
-    affected_autnum_if_filteres: Dict[str, Set[str]] = {}
+    # number of prefixes and number of autnum per as-set, accumulated while
+    # finding the common as-sets of each autnum
+    stats_per_as_set: Dict[str, List[int]] = {}
+    # autnum under the same as-sets have the same paths, so we calculate the
+    # intersection once per group of paths
+    common_per_paths: Dict[FrozenSet[FrozenSet[str]], FrozenSet[str]] = {}
+    # the paths are intersected as int bitmasks, one bit per as-set. Paths
+    # are shared among autnum, so each one is converted once
+    bit_per_asset: Dict[str, int] = {}
+    asset_per_bit: List[str] = []
+    mask_per_path: Dict[FrozenSet[str], int] = {}
     for auntum, paths in paths_per_autnum.items():
-        common = reduce(lambda x, y: x & y, paths)
+        paths_key = frozenset(paths)
+        if paths_key not in common_per_paths:
+            common_mask = -1 if paths else 0
+            for path in paths:
+                if path not in mask_per_path:
+                    mask_per_path[path] = to_bitmask(path, bit_per_asset, asset_per_bit)
+                common_mask &= mask_per_path[path]
+                if not common_mask:
+                    break
+            common_per_paths[paths_key] = from_bitmask(common_mask, asset_per_bit)
+        common = common_per_paths[paths_key]
+        if not common:
+            continue
+        autnum_prefixes = num_prefixes_per_autum[auntum]
         for as_set in common:
-            affected_autnum_if_filteres.setdefault(as_set, set()).add(auntum)
+            as_set_stats = stats_per_as_set.get(as_set)
+            if as_set_stats is None:
+                stats_per_as_set[as_set] = [autnum_prefixes, 1]
+            else:
+                as_set_stats[0] += autnum_prefixes
+                as_set_stats[1] += 1
 
-    stats_per_as_set: Dict[str, Tuple[int, int]] = {}
-    for asset, autumsets in affected_autnum_if_filteres.items():
-        stats_per_as_set[asset] = (
-            sum(num_prefixes_per_autum[x] for x in autumsets),
-            len(autumsets),
-        )
-
-    return stats_per_as_set
+    return {
+        as_set: (as_set_stats[0], as_set_stats[1])
+        for as_set, as_set_stats in stats_per_as_set.items()
+    }
 
 
 def _find_origin_asn_per_parent_set(
     root_as_set: str,
     parent_set: FrozenSet[str],
-    parents_sets: Dict[FrozenSet[set], Set[str]],
-    parents_per_object: Dict[str, Set[str]],
-    single_links_to_root_per_parent_set: Dict[FrozenSet[str], FrozenSet[str]],
+    parent_bits_per_parent_set: Dict[FrozenSet[str], List[int]],
+    parent_set_per_bit: List[FrozenSet[str]],
+    single_links_mask_per_parent_set: Dict[FrozenSet[str], int],
 ):
-    if parent_set in single_links_to_root_per_parent_set:
+    """
+    Iterative post-order traversal over the parent sets. A parent set is
+    resolved once the parent sets of all its parents are resolved.
+    The parents are handled by their bit (see to_bitmask): the parents of
+    each parent set are in parent_bits_per_parent_set, and the parent set of
+    each parent in parent_set_per_bit. The single links are kept as int
+    bitmasks.
+    """
+    if parent_set in single_links_mask_per_parent_set:
         return
 
-    # this is a trivial case, if we are linked directly to the root, we really
-    # cannot filter this element
-    if root_as_set in parent_set:
-        single_links_to_root_per_parent_set[parent_set] = frozenset()
-        return
+    in_progress: Set[FrozenSet[str]] = set()
+    stack: List[Tuple[FrozenSet[str], bool]] = [(parent_set, False)]
+    while stack:
+        this_parent_set, done = stack.pop()
+        if this_parent_set in single_links_mask_per_parent_set:
+            continue
 
-    common_links_per_parent: Set[FrozenSet[str]] = set()
-    for parent in parent_set:
-        parent_parent_set: FrozenSet[str] = frozenset(parents_per_object[parent])
-        if parent_parent_set not in single_links_to_root_per_parent_set:
-            _find_origin_asn_per_parent_set(
-                root_as_set,
-                parent_parent_set,
-                parents_sets,
-                parents_per_object,
-                single_links_to_root_per_parent_set,
-            )
-        # we need to add the parent links and the parent itself
-        common_links_per_parent.add(
-            single_links_to_root_per_parent_set[parent_parent_set] | frozenset([parent])
-        )
+        # this is a trivial case, if we are linked directly to the root, we really
+        # cannot filter this element
+        if root_as_set in this_parent_set:
+            single_links_mask_per_parent_set[this_parent_set] = 0
+            continue
 
-    if common_links_per_parent:
-        all_parents_common_links: Set[str] = set(
-            reduce(lambda x, y: x & y, common_links_per_parent)
-        )
-    else:
-        all_parents_common_links = set()
+        if not done:
+            if this_parent_set in in_progress:
+                continue
+            # first visit, resolve the parent sets of the parents before this one
+            in_progress.add(this_parent_set)
+            stack.append((this_parent_set, True))
+            for parent_bit in parent_bits_per_parent_set[this_parent_set]:
+                parent_parent_set = parent_set_per_bit[parent_bit]
+                if parent_parent_set in single_links_mask_per_parent_set:
+                    continue
+                if parent_parent_set in in_progress:
+                    # a cycle in the parents, it will be resolved as having
+                    # no single links
+                    continue
+                stack.append((parent_parent_set, False))
+            continue
 
-    single_links_to_root_per_parent_set[parent_set] = frozenset(
-        all_parents_common_links
-    )
+        in_progress.discard(this_parent_set)
+        # we need to intersect the parent links plus the parent itself
+        all_parents_common_links = -1 if this_parent_set else 0
+        for parent_bit in parent_bits_per_parent_set[this_parent_set]:
+            all_parents_common_links &= single_links_mask_per_parent_set.get(
+                parent_set_per_bit[parent_bit], 0
+            ) | (1 << parent_bit)
+            if not all_parents_common_links:
+                break
+
+        single_links_mask_per_parent_set[this_parent_set] = all_parents_common_links
 
 
 def find_origin_asn_single_connected(
@@ -154,25 +206,51 @@ def find_origin_asn_single_connected(
     TODO: Still in development
     """
 
+    # the parent set of each object, built once and shared by all the lookups.
+    # Equal parent sets share the same (canonical) object, so the dict lookups
+    # by parent set are resolved by identity.
+    parent_set_per_object: Dict[str, FrozenSet[str]] = {}
+    canonical_parent_sets: Dict[FrozenSet[str], FrozenSet[str]] = {}
     parents_sets: Dict[FrozenSet[str], Set[str]] = {}
     for element, this_element_parent_set in parents_per_object.items():
-        parents_sets.setdefault(frozenset(this_element_parent_set), set()).add(element)
+        parent_set = frozenset(this_element_parent_set)
+        parent_set = canonical_parent_sets.setdefault(parent_set, parent_set)
+        parent_set_per_object[element] = parent_set
+        parents_sets.setdefault(parent_set, set()).add(element)
+
+    # each parent gets a bit (an id), the links to the root are intersected as
+    # bitmasks, and the parents are looked up by their bit
+    bit_per_asset: Dict[str, int] = {}
+    asset_per_bit: List[str] = []
+    parent_bits_per_parent_set: Dict[FrozenSet[str], List[int]] = {}
+    for parent_set in parents_sets:
+        parent_bits_per_parent_set[parent_set] = [
+            get_bit(parent, bit_per_asset, asset_per_bit) for parent in parent_set
+        ]
+    # the root does not have parents, but its parent sets are never looked up
+    parent_set_per_bit: List[FrozenSet[str]] = [
+        parent_set_per_object.get(parent, frozenset()) for parent in asset_per_bit
+    ]
 
-    single_links_to_root_per_parent_set: Dict[FrozenSet[str], FrozenSet[str]] = {}
+    single_links_mask_per_parent_set: Dict[FrozenSet[str], int] = {}
     for parent_set in parents_sets:
         _find_origin_asn_per_parent_set(
             root_as_set,
             parent_set,
-            parents_sets,
-            parents_per_object,
-            single_links_to_root_per_parent_set,
+            parent_bits_per_parent_set,
+            parent_set_per_bit,
+            single_links_mask_per_parent_set,
         )
 
     # now find for each object
+    as_set_flags = get_as_set_flags(members_per_asset)
     affected_autnum_per_asset: Dict[str, Set[str]] = {}
-    for parent_set, single_links in single_links_to_root_per_parent_set.items():
+    for parent_set, single_links_mask in single_links_mask_per_parent_set.items():
+        if not single_links_mask:
+            continue
+        single_links = from_bitmask(single_links_mask, asset_per_bit)
         for element in parents_sets.get(parent_set, set()):
-            if "-" in element:
+            if as_set_flags[element]:
                 continue
             for asset in single_links:
                 affected_autnum_per_asset.setdefault(asset, set()).add(element)
@@ -185,25 +263,37 @@ def find_parents_per_member(
     members_per_asset: ASMembersType,
     parents_per_object: Dict[str, Set[str]],
     parents: Set[str],
-    level: int,
     visited_assets: Set[str],
 ):
-    if asset in parents:
-        return
-    if asset in visited_assets:
-        return
-    visited_assets.add(asset)
-    new_parents = parents | set([asset])
-    for member in members_per_asset[asset]:
-        if member in new_parents:
+    """
+    Populates parents_per_object with the parents of each member under asset,
+    ignoring links towards as-sets in the path (recursivity).
+    Each as-set is visited once. The traversal uses an explicit stack, each
+    as-set is pushed twice, once for entering it and once for leaving it.
+    """
+    as_set_flags = get_as_set_flags(members_per_asset)
+    new_parents = set(parents)
+    stack: List[Tuple[str, bool]] = [(asset, False)]
+    while stack:
+        this_asset, leaving = stack.pop()
+        if leaving:
+            new_parents.discard(this_asset)
             continue
-        parents_per_object.setdefault(member, set()).add(asset)
-        if "-" in member:
-            find_parents_per_member(
-                member,
-                members_per_asset,
-                parents_per_object,
-                new_parents,
-                level + 1,
-                visited_assets,
-            )
+        if this_asset in new_parents:
+            continue
+        if this_asset in visited_assets:
+            continue
+        visited_assets.add(this_asset)
+        new_parents.add(this_asset)
+        stack.append((this_asset, True))
+
+        as_set_members: List[str] = []
+        for member in members_per_asset[this_asset]:
+            if member in new_parents:
+                continue
+            parents_per_object.setdefault(member, set()).add(this_asset)
+            # as-sets are visited only once, no need to push the visited ones
+            if as_set_flags[member] and member not in visited_assets:
+                as_set_members.append(member)
+        # reversed, so they are visited in the same order as the members
+        stack.extend((member, False) for member in reversed(as_set_members))
@@ -1,7 +1,7 @@
 import argparse
-from typing import Any
+from typing import Any, Optional, Set
 
-from .datamodels import IRRAsciiTreeOptions, re_asn, MembersSorting
+from .datamodels import IRRAsciiTreeOptions, re_asn, MembersSorting, is_as_set
 
 
 def validate_asn(asn_text: str) -> str:
@@ -10,6 +10,27 @@ def validate_asn(asn_text: str) -> str:
     return asn_text
 
 
+def parse_asset_filters(asset_filters: Optional[str]) -> Set[str]:
+    """
+    Returns the as-sets of a comma separated list of filters, raising an
+    exception if any of them is not a valid as-set
+    """
+    if not asset_filters:
+        return set()
+    # repeated filters are validated once
+    candidate_filters = {
+        candidate_filter.strip() for candidate_filter in asset_filters.split(",")
+    }
+    invalid = {
+        candidate_filter
+        for candidate_filter in candidate_filters
+        if not is_as_set(candidate_filter)
+    }
+    if invalid:
+        raise Exception(f"The next are not valid as-sets for filters: {invalid}")
+    return candidate_filters
+
+
 def validate_positive_int(value) -> int:
     """
     Positive int validator for argparse
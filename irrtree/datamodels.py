@@ -1,6 +1,7 @@
 import re
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from pathlib import Path
+from dataclasses import dataclass, fields
 
 from enum import Enum
 
@@ -15,19 +16,50 @@ class ParseException(Exception):
 # TypeAlias
 IRRTree = Dict[str, "IRRTree"]
 
-re_asn = re.compile(r"^[aA][sS]\d+")
-re_starts_asn = re.compile(r"^[aA][sS]")
-re_as_set = re.compile(r"^[aA][sS]-.*")
+re_asn = re.compile(r"^[aA][sS]\d+", re.ASCII)
+re_starts_asn = re.compile(r"^[aA][sS]", re.ASCII)
+re_as_set = re.compile(r"^[aA][sS]-.*", re.ASCII)
+# matches the same as re_asn or re_as_set, with a single match
+re_asn_or_as_set = re.compile(r"[aA][sS][-0-9]", re.ASCII)
 
 TIME_FORMAT = "%Y-%m-%d %H:%M"
 
 
 def is_as_set(as_set_text: str) -> bool:
-    if not re_starts_asn.match(as_set_text):
-        return False
-    if "-" in as_set_text:
-        return True
-    return False
+    """
+    Same as matching re_starts_asn and looking for a "-", without the regex
+    >>> is_as_set("AS-ALSARD-SET")
+    True
+    >>> is_as_set("as28685:as-customers")
+    True
+    >>> is_as_set("AS28685")
+    False
+    >>> is_as_set("RS-ALSARD")
+    False
+    """
+    return (
+        len(as_set_text) >= 3
+        and as_set_text[0] in "aA"
+        and as_set_text[1] in "sS"
+        and "-" in as_set_text
+    )
+
+
+def get_as_set_flags(members_per_asset: Dict[str, Set[str]]) -> Dict[str, bool]:
+    """
+    Returns, for every object in members_per_asset (as-sets and members), if
+    it is an as-set (it has a "-") or an autnum. Used by the traversals, so
+    the names are classified once.
+    >>> sorted(get_as_set_flags({"AS-A": {"AS-B", "AS1"}, "AS-B": set()}).items())
+    [('AS-A', True), ('AS-B', True), ('AS1', False)]
+    """
+    as_set_flags: Dict[str, bool] = {}
+    for as_set, members in members_per_asset.items():
+        as_set_flags[as_set] = "-" in as_set
+        for member in members:
+            if member not in as_set_flags:
+                as_set_flags[member] = "-" in member
+    return as_set_flags
 
 
 # from https://github.com/pydantic/pydantic/blob/0c54c35ba61901d355734f9af3e4395af561f88c/pydantic/_internal/_repr.py#L37
@@ -48,6 +80,9 @@ class IRRServerOptions:
     sources_list: Optional[str] = None
 
     max_restarts: int = 3  # it should be conint(ge=1) if using pydantic
+    # queries (for members or prefixes) sent back to back before reading
+    # their answers
+    pipelined_queries: int = 10  # it should be conint(ge=1) if using pydantic
     date: Optional[datetime] = None
 
     # as-sets to remove from the irrtree
@@ -55,6 +90,10 @@ class IRRServerOptions:
     search: Optional[str] = None
     # remove cycles
     remove_recursivity: bool = False
+    # file to cache the prefixes per autnum across runs, and the seconds they
+    # are valid
+    prefix_cache: Optional[Path] = None
+    prefix_cache_ttl: int = 24 * 3600
 
 
 @dataclass
@@ -112,6 +151,31 @@ first_line_parser = re.compile(
     r"^IRRTree \((.*)\) report for '(.*)' \((.*)\), using (.*) at (.*)$"
 )
 
+FIRST_LINE_START = "IRRTree ("
+FIRST_LINE_SEPARATORS = (") report for '", "' (", "), using ", " at ")
+
+
+def _split_first_line(line: str) -> Optional[Tuple[str, ...]]:
+    """
+    Returns the same groups as first_line_parser, but using str.find. Returns
+    None if the line does not have the expected pieces (e.g. the regex should
+    be used)
+    >>> _split_first_line("IRRTree (1.4.0) report for 'AS-ALSARD-SET' (IPv4), using rr.ntt.net at 2022-08-20 02:57")
+    ('1.4.0', 'AS-ALSARD-SET', 'IPv4', 'rr.ntt.net', '2022-08-20 02:57')
+    """
+    if not line.startswith(FIRST_LINE_START) or "\n" in line:
+        return None
+    groups = []
+    position = len(FIRST_LINE_START)
+    for separator in FIRST_LINE_SEPARATORS:
+        separator_position = line.find(separator, position)
+        if separator_position < 0:
+            return None
+        groups.append(line[position:separator_position])
+        position = separator_position + len(separator)
+    groups.append(line[position:])
+    return tuple(groups)
+
 
 @dataclass
 class IrrRunData:
@@ -137,13 +201,15 @@ class IrrRunData:
             warnings.append("The files seem to be equal")
             return results
 
-        self_dict = asdict(self)
-        other_dict = asdict(other)
-
-        del self_dict["date"]
-        del other_dict["date"]
+        # core metadata, all but the date. The dicts are only built for the
+        # warning
+        core_equal = all(
+            getattr(self, x) == getattr(other, x) for x in IRR_RUN_DATA_CORE_FIELDS
+        )
 
-        if self_dict != other_dict:
+        if not core_equal:
+            self_dict = {x: getattr(self, x) for x in IRR_RUN_DATA_CORE_FIELDS}
+            other_dict = {x: getattr(other, x) for x in IRR_RUN_DATA_CORE_FIELDS}
             warnings.append(
                 f"Some of the core metadata is different from one file to the other, from {self_dict} to {other_dict}"
             )
@@ -160,10 +226,12 @@ class IrrRunData:
         """
         Returns IrrRunData from text
         """
-        result = first_line_parser.match(line)
-        if result is None:
-            raise ParseException(f"Error parsing irr data from line '{line}'")
-        groups = result.groups()
+        groups = _split_first_line(line)
+        if groups is None:
+            result = first_line_parser.match(line)
+            if result is None:
+                raise ParseException(f"Error parsing irr data from line '{line}'")
+            groups = result.groups()
         irr_version = groups[0]
         as_set = groups[1]
         version_text = groups[2]
@@ -190,3 +258,7 @@ class IrrRunData:
         "IRRTree (1.4.0) report for 'AS-ALSARD-SET' (IPv4), using rr.ntt.net at 2022-08-20 02:57"
         """
         return f"IRRTree ({self.irr_version}) report for '{self.as_set}' (IPv{self.ipversion}), using {self.server} at {self.date.strftime('%Y-%m-%d %H:%M')}"
+
+
+# fields compared by IrrRunData.compare
+IRR_RUN_DATA_CORE_FIELDS = tuple(x.name for x in fields(IrrRunData) if x.name != "date")
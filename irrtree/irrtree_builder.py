@@ -1,56 +1,104 @@
-from typing import Dict, Any, Set
-import asciitree
+from typing import Dict, Set, List, Tuple, Iterator, Optional
 
 from .irrtree_parser import IrrRunData, ASDataType, ASMembersType, ParseException
+from .parse_ascii_tree import CHILD_HEAD, CHILD_TAIL, LAST_CHILD_TAIL
+from .datamodels import get_as_set_flags
+
+SortKey = Tuple[int, int, str]
+
+
+def get_sort_keys(as_sets_data: ASDataType) -> Dict[str, SortKey]:
+    """
+    Returns the key used for sorting the members of the tree, per object.
+    Default sorting for the tree as done in irrtree
+    HOWEVER, it would be better to sort by name to minimize diffs
+    """
+    return {
+        as_set: (
+            0 if not data.asn_count else -data.asn_count,
+            0 if not data.pfx_count else -data.pfx_count,
+            data.as_set,
+        )
+        for as_set, data in as_sets_data.items()
+    }
+
+
+def get_sorted_members(
+    as_sets_data: ASDataType, as_sets_members: ASMembersType
+) -> Dict[str, List[str]]:
+    """
+    Returns the members of each as-set, sorted as printed in the tree
+    """
+    sort_key = get_sort_keys(as_sets_data).__getitem__
+    return {
+        as_set: sorted(members, key=sort_key)
+        for as_set, members in as_sets_members.items()
+    }
 
 
 def build_ascii_tree(
     as_set: str,
     as_sets_data: ASDataType,
     as_sets_members: ASMembersType,
-    tree: Dict[str, Any],
+    output: List[str],
     seen: Set[str],
+    sorted_members_per_asset: Optional[Dict[str, List[str]]] = None,
 ) -> None:
     """
     Builds the tree reesembling the one use in irrtree to create its output.
-    Recursive. Does not return anything but populates the tree object.
+    Iterative (explicit stack). Does not return anything but appends the lines
+    of the members of as_set to output, drawn as the LeftAligned() object of
+    asciitree would do it (see draw_ascii_tree).
     The trick is to add the  - already expanded" when needed
-    The tree consists in a recusive TreeType = Dict[str, Union[str, TreeType],
-    that we cannot obtain with python yet the str is an as-set with its data,
-    and the children are the contained as-sets.
     If an as-set was expanded, it does not have children and you add the  -
     already expanded
+    sorted_members_per_asset can be given to reuse them among calls (see
+    get_sorted_members)
     """
-    # here dict should be ordered, so this puts a limit in the python version
-    # we can run
     if as_set in seen:
         raise ParseException(f"Found {as_set} in seen")
     seen.add(as_set)
 
-    # default sorting for the tree as done in irrtree
-    # HOWEVER, it would be better to sort by name to
-    # minimize diffs
-    def sort_key(as_set):
-        data = as_sets_data[as_set]
-        return (
-            0 if not data.asn_count else -data.asn_count,
-            0 if not data.pfx_count else -data.pfx_count,
-            data.as_set,
-        )
+    this_sorted_members_per_asset: Dict[str, List[str]] = (
+        sorted_members_per_asset
+        if sorted_members_per_asset is not None
+        else get_sorted_members(as_sets_data, as_sets_members)
+    )
 
-    sorted_members = sorted(as_sets_members[as_set], key=sort_key)
-    for member in sorted_members:
+    as_set_flags = get_as_set_flags(as_sets_members)
+
+    def sorted_members(this_as_set: str) -> Iterator[Tuple[int, str]]:
+        return enumerate(this_sorted_members_per_asset[this_as_set])
+
+    # each frame keeps the prefix of the lines, the position of the last
+    # member and the members still to print.
+    # The members of an as-set are printed before moving to the next sibling.
+    stack: List[Tuple[str, int, Iterator[Tuple[int, str]]]] = [
+        ("", len(as_sets_members[as_set]) - 1, sorted_members(as_set))
+    ]
+    while stack:
+        prefix, last_position, members = stack[-1]
+        position, member = next(members, (-1, ""))
+        if position < 0:
+            stack.pop()
+            continue
+        line = f"{prefix}{CHILD_HEAD}{as_sets_data[member]}"
         # print the autnum
-        if "-" not in member:
-            tree[f"{as_sets_data[member]}"] = {}
+        if not as_set_flags[member]:
+            output.append(line)
             continue
         # print the as-sets. If already expanded, dont do it recursively
         if member in seen:
-            tree[f"{as_sets_data[member]} - already expanded"] = {}
-        else:
-            member_tree: Dict[str, Any] = {}
-            build_ascii_tree(member, as_sets_data, as_sets_members, member_tree, seen)
-            tree[f"{as_sets_data[member]}"] = member_tree
+            output.append(f"{line} - already expanded")
+            continue
+        seen.add(member)
+        output.append(line)
+        member_prefix = prefix + (
+            LAST_CHILD_TAIL if position == last_position else CHILD_TAIL
+        )
+        stack.append(
+            (member_prefix, len(as_sets_members[member]) - 1, sorted_members(member))
+        )
 
 
 def build_irrtree_content(
@@ -61,15 +109,13 @@ def build_irrtree_content(
     as_sets_members
     """
     seen: Set[str] = set()
-    ascii_tree: Dict[str, Any] = {}
-    ascii_tree[f"{as_sets_data[metadata.as_set]}"] = {}
+    output: List[str] = [f"{metadata}", f"{as_sets_data[metadata.as_set]}"]
     build_ascii_tree(
         metadata.as_set,
         as_sets_data,
         as_sets_members,
-        ascii_tree[f"{as_sets_data[metadata.as_set]}"],
+        output,
         seen,
+        get_sorted_members(as_sets_data, as_sets_members),
     )
-    tr = asciitree.LeftAligned()
-    text = tr(ascii_tree)
-    return f"{metadata}\n{text}"
+    return "\n".join(output)
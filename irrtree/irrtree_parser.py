@@ -1,12 +1,31 @@
-from typing import Optional, Dict, Any, Tuple, List, Set
-from dataclasses import dataclass, asdict
+import re
+import sys
+from itertools import chain
+from typing import (
+    Optional,
+    Dict,
+    Any,
+    Tuple,
+    List,
+    Set,
+    Iterable,
+    Iterator,
+)
+from dataclasses import dataclass
 from .datamodels import (
     IRRAsciiTreeData,
     ASSetTree,
     IrrRunData,
 )
 
-from .parse_ascii_tree import parse_ascii_tree, ParseException
+from .parse_ascii_tree import iter_ascii_tree, iter_lines, ParseException
+
+# RE for the usual as-set data text, e.g. AS-CIVITELE (95 ASNs, 1848 pfxs).
+# Anything else goes through the step by step parsing (and its errors)
+as_data_parser = re.compile(
+    r"^(\S+) \((?:(\d+) ASNs(?:, (\d+) pfxs)?|(\d+) pfxs)\)$",
+    re.ASCII,
+)
 
 
 @dataclass
@@ -63,16 +82,27 @@ class AsSetSummaryData:
         asn_count: Optional[int] = None
         pfx_count: Optional[int] = None
 
-        opening_bracket_pos = as_data_strin.find("(")
+        result = as_data_parser.match(as_data_strin)
+        if result is not None:
+            as_set, asn_txt, asn_pfx_txt, pfx_txt = result.groups()
+            if asn_txt is not None:
+                asn_count = int(asn_txt)
+            if asn_pfx_txt is not None:
+                pfx_count = int(asn_pfx_txt)
+            elif pfx_txt is not None:
+                pfx_count = int(pfx_txt)
+            return cls(as_set=as_set, asn_count=asn_count, pfx_count=pfx_count)
+
+        text_before_bracket, opening_bracket, text_after_bracket = (
+            as_data_strin.partition("(")
+        )
 
-        if opening_bracket_pos >= 0:
-            closening_bracket_pos = as_data_strin.find(")")
-            if closening_bracket_pos < 0:
+        if opening_bracket:
+            parenthesis_txt, closening_bracket, _ = text_after_bracket.partition(")")
+            if not closening_bracket:
                 raise ParseException("as-set data opening parenthesis but not closing")
-            as_set = as_data_strin[: opening_bracket_pos - 1]
-            parenthesis_txt = as_data_strin[
-                opening_bracket_pos + 1 : closening_bracket_pos
-            ]
+            # the name is separated from the parenthesis by a space
+            as_set = text_before_bracket[:-1]
 
             for pieces in parenthesis_txt.split(","):
                 pieces = pieces.strip()
@@ -111,79 +141,75 @@ ASDataType = Dict[str, AsSetSummaryData]
 ASMembersType = Dict[str, Set[str]]
 
 
-def _get_minimumlevels(
-    level: int,
-    level_parents: Set[str],
-    level_parent_data: Dict[str, Tuple[int, Optional[str]]],
-    members_per_asset: ASMembersType,
-):
-    new_parents = set()
-    for parent in sorted(level_parents):
-        for member in members_per_asset[parent]:
-            # if there is data, we are done
-            if member in level_parent_data:
-                continue
-            level_parent_data[member] = (level, parent)
-            if "-" in member:
-                new_parents.add(member)
-    if new_parents:
-        _get_minimumlevels(level + 1, new_parents, level_parent_data, members_per_asset)
-
-
 def get_minimum_levels(
     root_as_set: str, members_per_asset: ASMembersType
 ) -> Dict[str, Tuple[int, Optional[str]]]:
+    """
+    For each object in members (both asset and autnum) returns the first level
+    (going level by level from the root) where it appears, and its parent on
+    that level (parents of a level are processed sorted by name)
+    """
     level_parent_data: Dict[str, Tuple[int, Optional[str]]] = {root_as_set: (0, None)}
-    _get_minimumlevels(0, set([root_as_set]), level_parent_data, members_per_asset)
+    level = 0
+    # a member is added to the parents of the next level only once (when it
+    # gets its data), so the parents are kept in lists
+    level_parents: List[str] = [root_as_set]
+    while level_parents:
+        new_parents: List[str] = []
+        level_parents.sort()
+        for parent in level_parents:
+            for member in members_per_asset[parent]:
+                # if there is data, we are done
+                if member in level_parent_data:
+                    continue
+                level_parent_data[member] = (level, parent)
+                if "-" in member:
+                    new_parents.append(member)
+        level_parents = new_parents
+        level += 1
     return level_parent_data
 
 
-def _get_levels(
-    as_set: str,
-    members_per_asset: ASMembersType,
-    level_parent_data: Dict[str, Set[Tuple[int, Optional[str]]]],
-    parents: Set[str],
-    parent: Optional[str],
-    level: int,
-    keep_minimum: bool = True,
-) -> None:
-    if as_set not in level_parent_data:
-        level_parent_data[as_set] = set()
-    level_parent_data[as_set].add((level, parent))
-
-    new_parents = parents | set([as_set])
-    new_level = level + 1
-
-    for member in members_per_asset[as_set]:
-        if "-" not in member:
-            if member not in level_parent_data:
-                level_parent_data[member] = set()
-            level_parent_data[member].add((new_level, as_set))
-            continue
-        if member in parents:
-            continue
-
-        _get_levels(
-            member, members_per_asset, level_parent_data, new_parents, as_set, new_level
-        )
-
-
 def get_levels(
     root_as_set: str, members_per_asset: ASMembersType
 ) -> Dict[str, Set[Tuple[int, Optional[str]]]]:
     """
     For each object in members (both asset and autnum) returns the levels
     (without recursivity) and parents on each level
+    The tree is traversed with an explicit stack, each element holds the as-set,
+    its parent and its level. The parents (the path to the as-set) are kept in
+    a single set, a leaving element (level None) removes the as-set from it.
     """
     level_parent_data: Dict[str, Set[Tuple[int, Optional[str]]]] = {}
-    _get_levels(
-        root_as_set,
-        members_per_asset,
-        level_parent_data,
-        parents=set(),
-        parent=None,
-        level=0,
-    )
+    parents: Set[str] = set()
+    stack: List[Tuple[str, Optional[str], Optional[int]]] = [(root_as_set, None, 0)]
+    while stack:
+        as_set, parent, level = stack.pop()
+        if level is None:
+            parents.discard(as_set)
+            continue
+        if as_set not in level_parent_data:
+            level_parent_data[as_set] = set()
+        level_parent_data[as_set].add((level, parent))
+
+        new_level = level + 1
+        as_set_members: List[str] = []
+        for member in members_per_asset[as_set]:
+            if "-" not in member:
+                if member not in level_parent_data:
+                    level_parent_data[member] = set()
+                level_parent_data[member].add((new_level, as_set))
+                continue
+            if member in parents:
+                continue
+            as_set_members.append(member)
+
+        # an as-set can be a member of itself, then it is already in the
+        # parents and it is removed when leaving the first one
+        if as_set not in parents:
+            parents.add(as_set)
+            stack.append((as_set, None, None))
+        stack.extend((member, as_set, new_level) for member in as_set_members)
     return level_parent_data
 
 
@@ -193,24 +219,39 @@ def get_as_data(
     as_sets_data: ASDataType,
     keep_minimum_level=True,
 ) -> List[Dict[str, Any]]:
-    df_one_data = []
+    df_one_data: List[Dict[str, Any]] = []
+    # rows are built with the attributes directly, asdict copies each field
     if not keep_minimum_level:
         levels = get_levels(metadata.as_set, as_members)
         for as_set, as_data in as_sets_data.items():
-            as_data_dict = asdict(as_data)
-            for level in levels[as_set]:
-                this_dict = dict(as_data_dict)
-                this_dict["level"] = level[0]
-                this_dict["parent"] = level[1]
-                df_one_data.append(this_dict)
+            set_name, asn_count, pfx_count = (
+                as_data.as_set,
+                as_data.asn_count,
+                as_data.pfx_count,
+            )
+            df_one_data.extend(
+                {
+                    "as_set": set_name,
+                    "asn_count": asn_count,
+                    "pfx_count": pfx_count,
+                    "level": level,
+                    "parent": parent,
+                }
+                for level, parent in levels[as_set]
+            )
     else:
         min_levels = get_minimum_levels(metadata.as_set, as_members)
         for as_set, as_data in as_sets_data.items():
-            as_data_dict = asdict(as_data)
-            min_level = min_levels[as_set]
-            as_data_dict["level"] = min_level[0]
-            as_data_dict["parent"] = min_level[1]
-            df_one_data.append(as_data_dict)
+            min_level, parent = min_levels[as_set]
+            df_one_data.append(
+                {
+                    "as_set": as_data.as_set,
+                    "asn_count": as_data.asn_count,
+                    "pfx_count": as_data.pfx_count,
+                    "level": min_level,
+                    "parent": parent,
+                }
+            )
     return df_one_data
 
 
@@ -220,9 +261,15 @@ def parse_key(tree_key: str) -> Tuple[AsSetSummaryData, bool]:
     the data in a AsSetSummaryData
     It retuns a second value with True if the AS was expanded before on the tree
     """
-    parenthesis_location = tree_key.find(")")
-    text_before_parenthesis = tree_key[: parenthesis_location + 1]
-    text_after_parenthesis = tree_key[parenthesis_location + 1 :].strip()
+    text_before_parenthesis, parenthesis, text_after_parenthesis = tree_key.partition(
+        ")"
+    )
+    if parenthesis:
+        text_before_parenthesis += parenthesis
+    else:
+        # without parenthesis, all the key is taken as the text after it
+        text_before_parenthesis, text_after_parenthesis = "", text_before_parenthesis
+    text_after_parenthesis = text_after_parenthesis.strip()
     if not text_after_parenthesis:
         already = False
     else:
@@ -232,6 +279,9 @@ def parse_key(tree_key: str) -> Tuple[AsSetSummaryData, bool]:
             )
         already = True
     data = AsSetSummaryData.parse_as_data(text_before_parenthesis)
+    # names repeat across the tree (members, levels, parents), a single
+    # interned copy is shared by all of them
+    data.as_set = sys.intern(data.as_set)
 
     if already and "-" not in data.as_set:
         raise ParseException("Found already expanded in a non as-set object")
@@ -239,6 +289,68 @@ def parse_key(tree_key: str) -> Tuple[AsSetSummaryData, bool]:
     return data, already
 
 
+def _add_irr_tree_element(
+    element: str,
+    parsed_element: Tuple[AsSetSummaryData, bool],
+    parent_element: Optional[str],
+    asset_data: ASDataType,
+    asset_members: ASMembersType,
+) -> Tuple[AsSetSummaryData, bool, bool]:
+    """
+    Adds the information of an element (key) of the ascii irrtree, already
+    parsed with parse_key, to the asset_data and asset_members.
+    Returns its data, True if it was already expanded, and True if its
+    children have to be visited
+    """
+    # the data, and if it has been expanded
+    as_data, already_expanded = parsed_element
+    if parent_element is not None:
+        # we should not be revisiting as-sets, since the irrtree takes care of this.
+        # the set does not grow when adding a member that was already there
+        # autnums only get an entry if they have members (they should not)
+        parent_members = asset_members.get(parent_element)
+        if parent_members is None:
+            parent_members = asset_members[parent_element] = set()
+        number_parent_members = len(parent_members)
+        parent_members.add(as_data.as_set)
+        if len(parent_members) == number_parent_members:
+            raise ParseException(
+                f"Re-adding {as_data.as_set} to {parent_element}. This should not happen"
+            )
+    # we it is expanded, we check the data is the same.
+    # this part is just for validation
+    if already_expanded:
+        if as_data.as_set not in asset_data:
+            raise ParseException(
+                f"AS in key {element} says it is expanded, but it is not"
+            )
+        # test that the data is the same
+        assert (
+            as_data == asset_data[as_data.as_set]
+        ), f"Found different data for as_set {as_data.as_set} in {element}"
+        return as_data, already_expanded, False
+
+    # if it is an as-set, and it says it is not expanded, it should nto be there
+    if as_data.as_set in asset_data:
+        if "-" in as_data.as_set:
+            raise ParseException(
+                f"AS in key {element} says seems to be not expanded, but it has"
+            )
+        else:
+            # if it is an AUTNUM, the data should bte the same
+            if not as_data == asset_data[as_data.as_set]:
+                raise ParseException(
+                    f"AUTNUM {as_data.as_set} has differnet stats in different parts of the tree: {as_data} and {asset_data[as_data.as_set]}"
+                )
+        return as_data, already_expanded, False
+
+    # if the as-set is not expanded, start the data for this member and visit it.
+    if "-" in as_data.as_set:
+        asset_members[as_data.as_set] = set()
+    asset_data[as_data.as_set] = as_data
+    return as_data, already_expanded, True
+
+
 def get_irr_tree_data(
     parsed_tree: Dict[str, Any],
     parent_element: Optional[str],
@@ -253,49 +365,15 @@ def get_irr_tree_data(
     It does not return anything
     """
 
-    for n, element in enumerate(parsed_tree):
-        # get the data, and check if it has been expanded
-        as_data, already_expanded = parse_key(element)
-        if parent_element is not None:
-            # we should not be revisiting as-sets, since the irrtree takes care of this.
-            if as_data.as_set in asset_members[parent_element]:
-                raise ParseException(
-                    f"Re-adding {as_data.as_set} to {parent_element}. This should not happen"
-                )
-            asset_members[parent_element].add(as_data.as_set)
-        # we it is expanded, we check the data is the same.
-        # this part is just for validation
-        if already_expanded:
-            if as_data.as_set not in asset_data:
-                raise ParseException(
-                    f"AS in key {element} says it is expanded, but it is not"
-                )
-            # test that the data is the same
-            assert (
-                as_data == asset_data[as_data.as_set]
-            ), f"Found different data for as_set {as_data.as_set} in {element}"
-            if parsed_tree[element]:
-                raise ParseException(
-                    f"Element {element} states it has been expanded, but it has elements"
-                )
-        else:
-            # if it is an as-set, and it says it is not expanded, it should nto be there
-            if as_data.as_set in asset_data:
-                if "-" in as_data.as_set:
-                    raise ParseException(
-                        f"AS in key {element} says seems to be not expanded, but it has"
-                    )
-                else:
-                    # if it is an AUTNUM, the data should bte the same
-                    if not as_data == asset_data[as_data.as_set]:
-                        raise ParseException(
-                            f"AUTNUM {as_data.as_set} has differnet stats in different parts of the tree: {as_data} and {asset_data[as_data.as_set]}"
-                        )
-                continue
-
-            # if the as-set is not expanded, start the data for this member and visit it.
-            asset_members[as_data.as_set] = set()
-            asset_data[as_data.as_set] = as_data
+    for element in parsed_tree:
+        as_data, already_expanded, visit = _add_irr_tree_element(
+            element, parse_key(element), parent_element, asset_data, asset_members
+        )
+        if already_expanded and parsed_tree[element]:
+            raise ParseException(
+                f"Element {element} states it has been expanded, but it has elements"
+            )
+        if visit:
             get_irr_tree_data(
                 parsed_tree[element],
                 as_data.as_set,
@@ -305,67 +383,168 @@ def get_irr_tree_data(
             )
 
 
-def parse_irrtree(text: str) -> Tuple[IrrRunData, ASDataType, ASMembersType]:
+def get_irr_tree_data_from_lines(
+    lines: Iterable[str],
+    asset_data: ASDataType,
+    asset_members: ASMembersType,
+) -> None:
     """
-    Parses a text containing a ascii tree with the output of the irrtree app.
+    Same as get_irr_tree_data on the output of parse_ascii_tree, but
+    adding the information while reading the lines of the ascii irrtree,
+    without building the tree.
+    It does not return anything
     """
-    if not text:
-        raise ParseException("Empty text provided to parse_irrtree")
+    # for each element in the current path of the tree, the as-set receiving
+    # its children (None if they are not visited) and the element if it was
+    # already expanded (it should not have children)
+    path: List[Tuple[Optional[str], Optional[str]]] = []
+    # autnums and already expanded as-sets repeat the same key across the
+    # tree, parse_key is run once per key
+    parsed_elements: Dict[str, Tuple[AsSetSummaryData, bool]] = {}
+    for depth, element in iter_ascii_tree(lines):
+        parent_element, expanded_element = path[depth - 1] if depth else (None, None)
+        del path[depth:]
+        if expanded_element is not None:
+            raise ParseException(
+                f"Element {expanded_element} states it has been expanded, but it has elements"
+            )
+        if depth and parent_element is None:
+            path.append((None, None))
+            continue
+        parsed_element = parsed_elements.get(element)
+        if parsed_element is None:
+            parsed_element = parsed_elements[element] = parse_key(element)
+        as_data, already_expanded, visit = _add_irr_tree_element(
+            element, parsed_element, parent_element, asset_data, asset_members
+        )
+        path.append(
+            (
+                as_data.as_set if visit else None,
+                element if already_expanded else None,
+            )
+        )
 
-    text = text.strip()
 
-    try:
-        first_line, irr_tree_ascii = text.split("\n", 1)
-    except Exception:
-        raise ParseException(
-            f"Problem getting first line of file of '{text}'. File with a single line?"
-        )
+def _skip_blank_lines(line: str, lines: Iterator[str]) -> Optional[str]:
+    """
+    Returns the first line that is not blank, from line and then the rest of
+    lines, removing the whitespace at the beginning of it (as strip() would do
+    with the text from line). None if all of them are blank
+    """
+    while not line.strip():
+        next_line = next(lines, None)
+        if next_line is None:
+            return None
+        line = next_line
+    return line.lstrip()
 
-    irr_tree_ascii = irr_tree_ascii.strip()
+
+def _iter_stripped_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Iterates over the lines (without their newline) of the text formed by
+    lines, after strip() (the blank lines at the beginning and the end
+    are skipped, and the first and last lines are stripped from that side)
+    >>> list(_iter_stripped_lines(["\\n", "  a\\n", "\\n", "b  \\n", " \\n"]))
+    ['a', '', 'b']
+    """
+    # the last line that is not blank, and the blank lines after it
+    pending: List[str] = []
+    for line in lines:
+        if line.endswith("\n"):
+            line = line[:-1]
+        if line.strip():
+            if pending:
+                yield from pending
+            else:
+                line = line.lstrip()
+            pending = [line]
+        elif pending:
+            pending.append(line)
+    if pending:
+        yield pending[0].rstrip()
+
+
+def _record_lines(lines: Iterator[str], read_lines: List[str]) -> Iterator[str]:
+    """
+    Iterates over lines, adding them to read_lines
+    """
+    for line in lines:
+        read_lines.append(line)
+        yield line
+
+
+def parse_irrtree_lines(
+    lines: Iterable[str],
+) -> Tuple[IrrRunData, ASDataType, ASMembersType]:
+    """
+    Parses the lines (for instance, of a file) of a text containing a ascii
+    tree with the output of the irrtree app. The lines are read one by one,
+    without building the text.
+    """
+    stripped_lines = _iter_stripped_lines(lines)
+    # the header lines are recorded for the errors, the text of the errors
+    # is the one of the lines read (from the header)
+    header_lines: List[str] = []
+    header = _record_lines(stripped_lines, header_lines)
 
     #  The metadata is the first line
+    first_line = next(header, "")
+    second_line = next(header, None)
+    if second_line is None:
+        raise ParseException(
+            f"Problem getting first line of file of '{first_line}'. File with a single line?"
+        )
     metadata = IrrRunData.parse_first_line(first_line)
+    tree_line = _skip_blank_lines(second_line, header)
 
     # we need to deal with the other two optional lines, for now we ignore them
-    if irr_tree_ascii.startswith("IRRTree extra options:"):
-        try:
-            _, irr_tree_ascii = irr_tree_ascii.split("\n", 1)
-        except Exception:
+    if tree_line is not None and tree_line.startswith("IRRTree extra options:"):
+        next_line = next(header, None)
+        if next_line is None:
+            text = "\n".join(header_lines)
             raise ParseException(
                 f"Problem getting extra options line of file of '{text}'. No more lines?"
             )
-        irr_tree_ascii = irr_tree_ascii.strip()
+        tree_line = _skip_blank_lines(next_line, header)
 
-    if irr_tree_ascii.startswith("IRRTree printing options:"):
-        try:
-            _, irr_tree_ascii = irr_tree_ascii.split("\n", 1)
-        except Exception:
+    if tree_line is not None and tree_line.startswith("IRRTree printing options:"):
+        next_line = next(header, None)
+        if next_line is None:
+            text = "\n".join(header_lines)
             raise ParseException(
                 f"Problem getting printing options line of file of '{text}'. No more lines?"
             )
-        irr_tree_ascii = irr_tree_ascii.strip()
+        tree_line = _skip_blank_lines(next_line, header)
 
-    # we obtain the tree using the parse_ascii_tree function
-    # and process it with get_irr_tree_data to obtain
-    # the as_sets_members (members for each as-set)
+    # we read the lines of the ascii tree with get_irr_tree_data_from_lines
+    # to obtain the as_sets_members (members for each as-set)
     # and as_sets_data (the infor of pfx and prefixes per asn)
     as_sets_data: ASDataType = {}
     as_sets_members: ASMembersType = {}
-    ascii_tree = parse_ascii_tree(irr_tree_ascii)
-    get_irr_tree_data(ascii_tree, None, as_sets_data, as_sets_members, 0)
-    # autnum should not have any members, check that and delete them
-    for member in set(as_sets_members):
-        if "-" in member:
-            continue
-        if as_sets_members[member]:
+    if tree_line is not None:
+        # the rest of the lines are not recorded
+        get_irr_tree_data_from_lines(
+            chain([tree_line], stripped_lines), as_sets_data, as_sets_members
+        )
+    # autnum should not have any members, they only have an entry if they do
+    for member, members in as_sets_members.items():
+        if "-" not in member:
             raise ParseException(
-                f"AUTNUM {member} has memmbers: {as_sets_members[member]}, this makes no sense"
+                f"AUTNUM {member} has memmbers: {members}, this makes no sense"
             )
-        del as_sets_members[member]
 
     return metadata, as_sets_data, as_sets_members
 
 
+def parse_irrtree(text: str) -> Tuple[IrrRunData, ASDataType, ASMembersType]:
+    """
+    Parses a text containing a ascii tree with the output of the irrtree app.
+    """
+    if not text:
+        raise ParseException("Empty text provided to parse_irrtree")
+    return parse_irrtree_lines(iter_lines(text))
+
+
 def convert_to_irrasciitree(
     metadata: IrrRunData, as_sets_data: ASDataType, as_sets_members: ASMembersType
 ) -> IRRAsciiTreeData:
@@ -407,3 +586,10 @@ def parse_irrtree_return_irrasciitreedata(
 ) -> Tuple[IrrRunData, IRRAsciiTreeData]:
     metadata, as_sets_data, as_sets_members = parse_irrtree(text)
     return metadata, convert_to_irrasciitree(metadata, as_sets_data, as_sets_members)
+
+
+def parse_irrtree_lines_return_irrasciitreedata(
+    lines: Iterable[str],
+) -> Tuple[IrrRunData, IRRAsciiTreeData]:
+    metadata, as_sets_data, as_sets_members = parse_irrtree_lines(lines)
+    return metadata, convert_to_irrasciitree(metadata, as_sets_data, as_sets_members)
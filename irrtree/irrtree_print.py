@@ -1,9 +1,13 @@
+from dataclasses import fields
 from datetime import datetime
-from typing import Dict, Tuple, Optional, Set, Any
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Tuple, Optional, Set, List
 import json
+import sys
 
-import asciitree
 import irrtree
+from irrtree.parse_ascii_tree import draw_ascii_tree_lines
 from irrtree.datamodels import (
     IRRAsciiTreeOptions,
     IRRAsciiTreeData,
@@ -11,7 +15,6 @@ from irrtree.datamodels import (
     MembersSorting,
     IRRTree,
     TIME_FORMAT,
-    asdict,
 )
 
 
@@ -89,64 +92,73 @@ def print_branch(
     filtered_members = set()
     filtered_direct_asns = set()
 
+    # bound once, they are used for every member
+    number_prefixes_per_asset = data.number_prefixes_per_asset
+    number_origin_asn_per_asset = data.number_origin_asn_per_asset
+    number_prefixes_per_asn = data.number_prefixes_per_asn
+    show_autnum = irrtree_options.show_autnum
+    filter_less_prefixes_than = irrtree_options.filter_less_prefixes_than
+
     # we will sort the data, so this is only temporal
-    # key is the member key, data is the tree key, its subtree, number of prefixes and origin asns
-    unsorted_member_data: Dict[str, Tuple[int, int]] = {}
+    # key is the member key, data is the number of prefixes and origin asns, and
+    # if it is an as-set (so members are classified only once)
+    unsorted_member_data: Dict[str, Tuple[int, int, bool]] = {}
 
     for member in data.as_set_tree.members_per_asset[asset]:
         if "-" not in member:
             # this is an autnum
             # do not show if not set
-            if not irrtree_options.show_autnum:
+            if not show_autnum:
                 filtered_direct_asns.add(member)
                 continue
 
-            member_prefixes: int = data.number_prefixes_per_asn[member]
+            member_prefixes: int = number_prefixes_per_asn[member]
 
             # do not show if there is a filter for max number of prefixs
             if (
-                irrtree_options.filter_less_prefixes_than
-                and irrtree_options.filter_less_prefixes_than > member_prefixes
+                filter_less_prefixes_than
+                and filter_less_prefixes_than > member_prefixes
             ):
                 filtered_direct_asns.add(member)
                 continue
 
-            unsorted_member_data[member] = (member_prefixes, 0)
+            unsorted_member_data[member] = (member_prefixes, 0, False)
             continue
 
         # now we deal with assets
-        member_prefixes = data.number_prefixes_per_asset[member]
-        if (
-            irrtree_options.filter_less_prefixes_than
-            and irrtree_options.filter_less_prefixes_than > member_prefixes
-        ):
+        member_prefixes = number_prefixes_per_asset[member]
+        if filter_less_prefixes_than and filter_less_prefixes_than > member_prefixes:
             # we will hide it
             filtered_members.add(member)
             continue
 
         # fill the metrics for the member
         unsorted_member_data[member] = (
-            data.number_prefixes_per_asset[member],
-            data.number_origin_asn_per_asset[member],
+            member_prefixes,
+            number_origin_asn_per_asset[member],
+            True,
         )
 
-    # let us find the metric for the members
-    metric_per_member: Dict[str, Any] = {}
+    # let us sort the members, with the sort key computed once per member
+    sorted_members: List[str]
     if irrtree_options.sorting_option == MembersSorting.by_name:
-        metric_per_member = {x: x for x in unsorted_member_data}
+        sorted_members = sorted(unsorted_member_data)
     elif irrtree_options.sorting_option == MembersSorting.by_prefix_count:
         # here it is prefix count, then asn count then name
-        metric_per_member = {
-            x: (-v[0], -v[1], x) for x, v in unsorted_member_data.items()
-        }
+        decorated_members = [
+            ((-prefixes, -asns, member), member)
+            for member, (prefixes, asns, _) in unsorted_member_data.items()
+        ]
+        decorated_members.sort(key=itemgetter(0))
+        sorted_members = [member for _, member in decorated_members]
     else:
         raise Exception("Option irrtree_options.sorting_option not supported")
 
-    for member in sorted(unsorted_member_data, key=lambda x: metric_per_member[x]):
-        member_prefixes, *_ = unsorted_member_data[member]
+    for member in sorted_members:
+        member_prefixes, _, is_as_set = unsorted_member_data[member]
 
         # fill up the details
-        if "-" in member:
+        if is_as_set:
             member_key, member_branch = print_branch(
                 member, data, seen_assets, new_level, irrtree_options
             )
@@ -167,19 +179,22 @@ def print_branch(
     return (asset_key, branch)
 
 
-def print_asset_tree(
+def iter_asset_tree(
     data: IRRAsciiTreeData,
     server_options: IRRServerOptions,
     irrtree_options: IRRAsciiTreeOptions,
-) -> str:
-    output = []
+) -> Iterator[str]:
+    """
+    Iterates over the lines of the irrtree report (without line breaks), so
+    they can be written while drawing the tree
+    """
     if not server_options.date:
         date = datetime.now().strftime(TIME_FORMAT)
     else:
         date = server_options.date.strftime(TIME_FORMAT)
 
     root_object = data.as_set_tree.root_as_set
-    output.append(
+    yield (
         "IRRTree (%s) report for '%s' (IPv%i), using %s at %s"
         % (
             irrtree.__version__,
@@ -198,21 +213,51 @@ def print_asset_tree(
         extra_options["remove_recursivity"] = server_options.remove_recursivity
 
     if extra_options:
-        output.append(f"IRRTree extra options: {json.dumps(extra_options)}")
+        yield f"IRRTree extra options: {json.dumps(extra_options)}"
 
     # The next (optional) line for the printing options. We'll need to deal with the defaults
     # this is super mega cheating for now
-    printing_options = {
-        x: y for x, y in asdict(irrtree_options).items() if y is not None
-    }
+    printing_options: Dict[str, Any] = {}
+    for option_field in fields(irrtree_options):
+        value = getattr(irrtree_options, option_field.name)
+        if value is not None:
+            printing_options[option_field.name] = value
     if "show_autnum" in printing_options and printing_options["show_autnum"]:
         del printing_options["show_autnum"]
     if printing_options:
-        output.append(f"IRRTree printing options: {json.dumps(printing_options)}")
+        yield f"IRRTree printing options: {json.dumps(printing_options)}"
 
     seen_assets: Set[str] = set()
     root_key, tree = print_branch(root_object, data, seen_assets, 0, irrtree_options)
-    tr = asciitree.LeftAligned()
-    output.append((tr({root_key: tree})))
+    yield from draw_ascii_tree_lines({root_key: tree})
+
 
-    return "\n".join(output)
+def print_asset_tree(
+    data: IRRAsciiTreeData,
+    server_options: IRRServerOptions,
+    irrtree_options: IRRAsciiTreeOptions,
+) -> str:
+    return "\n".join(iter_asset_tree(data, server_options, irrtree_options))
+
+
+def write_asset_tree(lines: Iterable[str], output_file: Optional[Path] = None) -> None:
+    """
+    Writes the lines of the irrtree report (see iter_asset_tree) as they are
+    drawn, in stdout if there is not output file. The file is written in a
+    temporary file in the same directory, which replaces the output file only
+    once the report is complete.
+    """
+    irrtree_lines = (line + "\n" for line in lines)
+    if output_file is None:
+        sys.stdout.writelines(irrtree_lines)
+        return
+    temp_file = output_file.with_name(f".{output_file.name}.tmp")
+    try:
+        # the report is encoded in large chunks, independently of the locale
+        with temp_file.open("w", encoding="utf-8", buffering=1 << 20) as output:
+            output.writelines(irrtree_lines)
+        temp_file.replace(output_file)
+    except BaseException:
+        if temp_file.exists():
+            temp_file.unlink()
+        raise
@@ -1,8 +1,106 @@
+from typing import Iterable, Iterator, List, Tuple
+
 from .datamodels import IRRTree, ParseException
 
 
 ASCII_POINTER = "+--"
 DIVISOR = len(ASCII_POINTER) + 1
+# position of the key after the pointer, the +1 avoids a space
+KEY_START = len(ASCII_POINTER) + 1
+
+# the pieces of each line, as drawn by the LeftAligned() object of ascii tree
+CHILD_HEAD = f" {ASCII_POINTER} "
+CHILD_TAIL = " |  "
+LAST_CHILD_TAIL = " " * DIVISOR
+
+
+def draw_ascii_tree_lines(tree: IRRTree) -> Iterator[str]:
+    """
+    Iterates over the lines of the tree drawn by draw_ascii_tree, so
+    they can be joined with other lines without building the drawing first
+    >>> list(draw_ascii_tree_lines({"a": {"b": {}}}))
+    ['a', ' +-- b']
+    """
+    root_key, root_tree = next(iter(tree.items()))
+    yield root_key
+    # each element holds the key, its subtree, its prefix, and if it is the
+    # last child of its parent
+    stack: List[Tuple[str, IRRTree, str, bool]] = []
+    last = len(root_tree) - 1
+    stack.extend(
+        (key, subtree, "", n == last)
+        for n, (key, subtree) in reversed(list(enumerate(root_tree.items())))
+    )
+    while stack:
+        key, subtree, prefix, is_last = stack.pop()
+        yield f"{prefix}{CHILD_HEAD}{key}"
+        child_prefix = prefix + (LAST_CHILD_TAIL if is_last else CHILD_TAIL)
+        last = len(subtree) - 1
+        stack.extend(
+            (child_key, child_subtree, child_prefix, n == last)
+            for n, (child_key, child_subtree) in reversed(
+                list(enumerate(subtree.items()))
+            )
+        )
+
+
+def draw_ascii_tree(tree: IRRTree) -> str:
+    """
+    Draws the tree with the default values of the ascii tree LeftAligned()
+    object (only the first key of tree is taken as root), which is the
+    format read by parse_ascii_tree
+    >>> print(draw_ascii_tree({"a": {"b": {"c": {}}, "d": {"e": {}}}}))
+    a
+     +-- b
+     |   +-- c
+     +-- d
+         +-- e
+    """
+    return "\n".join(draw_ascii_tree_lines(tree))
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    """
+    Iterates over the lines of the text (as text.split("\\n")), without
+    building the list with all of them
+    >>> list(iter_lines("a\\n\\nb\\n"))
+    ['a', '', 'b', '']
+    """
+    start = 0
+    while True:
+        end = text.find("\n", start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_ascii_tree(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """
+    Iterates over the lines of an ascii tree formated with default values
+    of the ascii tree LeftAligned() object, returning the depth (0 for the
+    head of the tree) and the key of each line
+    >>> list(iter_ascii_tree(["a", " +-- b", " |   +-- c", " +-- d"]))
+    [(0, 'a'), (1, 'b'), (2, 'c'), (1, 'd')]
+    """
+    for n, line in enumerate(lines):
+        if not line:
+            continue
+        if n == 0:
+            # head of the tree
+            yield 0, line
+            continue
+        pointer_position = line.find(ASCII_POINTER)
+        if pointer_position < 0:
+            raise ParseException(f"Line {n} does not contain {ASCII_POINTER}")
+        key = line[pointer_position + KEY_START :]
+        elements_minus_space = pointer_position - 1
+        if elements_minus_space % DIVISOR:
+            raise ParseException(
+                f"Line {n} does not contain a number of chrs dividible by {DIVISOR} after removing the first space ({elements_minus_space})"
+            )
+        yield elements_minus_space // DIVISOR + 1, key
 
 
 def parse_ascii_tree(text: str) -> IRRTree:
@@ -12,28 +110,13 @@ def parse_ascii_tree(text: str) -> IRRTree:
     """
     tree: IRRTree = {}
     current_hierarchy = []
-    for n, line in enumerate(text.split("\n")):
-        if not line:
-            continue
-        if n == 0:
-            # head of the tree
-            key = line
-            tree[line] = {}
-            current_hierarchy.append(tree[line])
+    for depth, key in iter_ascii_tree(iter_lines(text)):
+        if not depth:
+            tree[key] = {}
+            current_hierarchy.append(tree[key])
             continue
-        else:
-            if ASCII_POINTER not in line:
-                raise ParseException(f"Line {n} does not contain {ASCII_POINTER}")
-            # the +1 at the end avoids a space
-            key = line[line.find(ASCII_POINTER) + len(ASCII_POINTER) + 1 :]
-            element_till_pointer = line[: line.find(ASCII_POINTER)]
-            elements_minus_space = len(element_till_pointer) - 1
-            if elements_minus_space % DIVISOR:
-                raise ParseException(
-                    f"Line {n} does not contain a number of chrs dividible by {DIVISOR} after removing the first space ({elements_minus_space})"
-                )
-            hierarchy = elements_minus_space // DIVISOR
-            current_tree = current_hierarchy[hierarchy]
-            current_tree[key] = {}
-            current_hierarchy = current_hierarchy[: hierarchy + 1] + [current_tree[key]]
+        current_tree = current_hierarchy[depth - 1]
+        current_tree[key] = {}
+        del current_hierarchy[depth:]
+        current_hierarchy.append(current_tree[key])
     return tree
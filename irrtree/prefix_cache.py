@@ -0,0 +1,89 @@
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+# prefixes are stored as the IRR server returns them, separated by spaces.
+# They are kept per server, since the default sources (an empty sources)
+# depend on the server
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS server_prefixes (
+    autnum TEXT NOT NULL,
+    irr_host TEXT NOT NULL,
+    irr_port INTEGER NOT NULL,
+    sources TEXT NOT NULL,
+    afi INTEGER NOT NULL,
+    prefixes TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (autnum, irr_host, irr_port, sources, afi)
+)
+"""
+
+
+def _connect(cache_file: Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(str(cache_file))
+    connection.execute(CREATE_TABLE)
+    return connection
+
+
+def load_cached_prefixes(
+    cache_file: Path,
+    autnums: Iterable[str],
+    irr_host: str,
+    irr_port: int,
+    sources_list: Optional[str],
+    afi: int,
+    ttl: int,
+) -> Dict[str, Set[str]]:
+    """
+    Returns the prefixes of the autnums found in the cache file, for the same
+    server, sources and afi, and stored less than ttl seconds ago.
+    """
+    min_ts = int(time.time()) - ttl
+    sources = sources_list or ""
+    prefixes_per_autun: Dict[str, Set[str]] = {}
+    connection = _connect(cache_file)
+    try:
+        query = (
+            "SELECT prefixes FROM server_prefixes WHERE autnum = ? AND irr_host = ?"
+            " AND irr_port = ? AND sources = ? AND afi = ? AND ts >= ?"
+        )
+        for autnum in autnums:
+            row = connection.execute(
+                query, (autnum, irr_host, irr_port, sources, afi, min_ts)
+            ).fetchone()
+            if row is not None:
+                # interned, as the prefixes resolved by the workers
+                prefixes_per_autun[autnum] = set(map(sys.intern, row[0].split()))
+    finally:
+        connection.close()
+    return prefixes_per_autun
+
+
+def store_prefixes(
+    cache_file: Path,
+    prefixes_per_autun: Dict[str, Set[str]],
+    irr_host: str,
+    irr_port: int,
+    sources_list: Optional[str],
+    afi: int,
+) -> None:
+    """
+    Stores (or replaces) the prefixes of the autnums of the server in the
+    cache file.
+    """
+    ts = int(time.time())
+    sources = sources_list or ""
+    connection = _connect(cache_file)
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO server_prefixes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (autnum, irr_host, irr_port, sources, afi, " ".join(prefixes), ts)
+                    for autnum, prefixes in prefixes_per_autun.items()
+                ),
+            )
+    finally:
+        connection.close()
@@ -1,7 +1,8 @@
 import logging
-from typing import Optional, Set, Dict, List, Tuple, FrozenSet
+import re
+import sqlite3
+from typing import Set, Dict, List, Tuple, FrozenSet, Iterator, Iterable
 import asyncio
-import copy
 
 import progressbar
 from irrtree.datamodels import (
@@ -10,29 +11,142 @@ from irrtree.datamodels import (
     ASSetTree,
     IRRAsciiTreeData,
 )
-from irrtree.query_workers import Worker, join_queue_or_workers
-from irrtree.irrtree_print import print_asset_tree
+from irrtree.query_workers import Worker, SimpleQueue, join_queue_or_workers
+from irrtree.irrtree_print import iter_asset_tree
+from irrtree.prefix_cache import load_cached_prefixes, store_prefixes
 
 
 LOGGER = logging.getLogger()
 
 
-def _remove_recursivity(
-    asset: str,
+def get_bit(
+    name: str, bit_per_object: Dict[str, int], object_per_bit: List[str]
+) -> int:
+    """
+    Returns the bit (a dense int id) of an object (as-set or autnum). New
+    objects get the next free bit
+    """
+    bit = bit_per_object.get(name)
+    if bit is None:
+        bit = len(object_per_bit)
+        bit_per_object[name] = bit
+        object_per_bit.append(name)
+    return bit
+
+
+def to_bitmask(
+    names: Iterable[str], bit_per_object: Dict[str, int], object_per_bit: List[str]
+) -> int:
+    """
+    Returns the objects as an int bitmask (see get_bit)
+    """
+    mask = 0
+    for name in names:
+        mask |= 1 << get_bit(name, bit_per_object, object_per_bit)
+    return mask
+
+
+# for each byte value, the positions of its bits set
+_BITS_PER_BYTE: List[Tuple[int, ...]] = [
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+]
+_NON_ZERO_BYTES = re.compile(rb"[^\x00]+")
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """
+    Iterates over the positions of the bits set in an int bitmask.
+    The mask is read as bytes, skipping the runs of zeros in C, so large
+    masks are decoded in linear time
+    >>> list(iter_bits(0b1000000101))
+    [0, 2, 9]
+    """
+    mask_bytes = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for non_zero_bytes in _NON_ZERO_BYTES.finditer(mask_bytes):
+        for position, byte in enumerate(non_zero_bytes.group(), non_zero_bytes.start()):
+            first_bit = position * 8
+            for bit in _BITS_PER_BYTE[byte]:
+                yield first_bit + bit
+
+
+def iter_bitmask(mask: int, object_per_bit: List[str]) -> Iterator[str]:
+    """
+    Iterates over the objects of an int bitmask built with to_bitmask
+    >>> list(iter_bitmask(0b1000000101, ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"]))
+    ['a', 'c', 'j']
+    """
+    return map(object_per_bit.__getitem__, iter_bits(mask))
+
+
+def from_bitmask(mask: int, object_per_bit: List[str]) -> FrozenSet[str]:
+    """
+    Returns the objects of an int bitmask built with to_bitmask
+    >>> sorted(from_bitmask(0b1000000101, ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"]))
+    ['a', 'c', 'j']
+    """
+    return frozenset(iter_bitmask(mask, object_per_bit))
+
+
+def _split_members(members: Set[str]) -> Tuple[List[str], List[str]]:
+    """
+    Returns the as-set members and the autnum members, classifying each
+    member only once
+    """
+    as_set_members: List[str] = []
+    autnum_members: List[str] = []
+    for member in members:
+        if "-" in member:
+            as_set_members.append(member)
+        else:
+            autnum_members.append(member)
+    return as_set_members, autnum_members
+
+
+def _sorted_as_set_members(members: Set[str]) -> List[str]:
+    """
+    Returns the as-set members sorted. Only as-sets define the traversals, so
+    autnums (usually most of the members) are left out of the sort
+    """
+    return sorted(member for member in members if "-" in member)
+
+
+def _find_recursive_links(
+    root_asset: str,
     members_per_asset: Dict[str, Set[str]],
-    parents: Set[str],
-    removed_links: Set[Tuple[str, str]],
-):
-    new_parents = set(parents)
-    new_parents.add(asset)
-    for member in sorted(members_per_asset[asset]):
-        if "-" not in member:
-            continue
-        if member in parents:
-            removed_links.add((asset, member))
-            members_per_asset[asset].remove(member)
-            continue
-        _remove_recursivity(member, members_per_asset, new_parents, removed_links)
+) -> Set[Tuple[str, str]]:
+    """
+    Finds the links to as-sets in the path from the root (back edges),
+    traversing the tree depth first (members sorted) with an explicit stack.
+    Each as-set is expanded only once, the members of an as-set that was
+    already expanded cannot link back to the current path (the links that
+    would do it were already found). Removing the links returned gives a tree
+    without recursivity
+    """
+    recursive_links: Set[Tuple[str, str]] = set()
+    in_path: Set[str] = {root_asset}
+    visited: Set[str] = {root_asset}
+    stack: List[Tuple[str, Iterator[str]]] = [
+        (root_asset, iter(_sorted_as_set_members(members_per_asset[root_asset])))
+    ]
+    while stack:
+        asset, members = stack[-1]
+        for member in members:
+            if member in in_path:
+                recursive_links.add((asset, member))
+                continue
+            if member in visited:
+                continue
+            # we expand the member, and come back to this as-set later
+            in_path.add(member)
+            visited.add(member)
+            stack.append(
+                (member, iter(_sorted_as_set_members(members_per_asset[member])))
+            )
+            break
+        else:
+            in_path.discard(asset)
+            stack.pop()
+    return recursive_links
 
 
 def remove_recursivity_from_tree(
@@ -41,11 +155,16 @@ def remove_recursivity_from_tree(
 ) -> Tuple[Dict[str, Set[str]], Set[Tuple[str, str]]]:
     """
     Returns a copy of the members_per_asset without recursivity, together with
-    the removed links
+    the removed links.
+    Only the members of the as-sets with removed links are copied, the rest are
+    shared with members_per_asset
     """
-    new_members_per_asset: Dict[str, Set[str]] = copy.deepcopy(members_per_asset)
-    removed_links: Set[Tuple[str, str]] = set()
-    _remove_recursivity(root_asset, new_members_per_asset, set(), removed_links)
+    removed_links = _find_recursive_links(root_asset, members_per_asset)
+    new_members_per_asset: Dict[str, Set[str]] = dict(members_per_asset)
+    for asset, member in removed_links:
+        if new_members_per_asset[asset] is members_per_asset[asset]:
+            new_members_per_asset[asset] = set(members_per_asset[asset])
+        new_members_per_asset[asset].discard(member)
     # some basic tests
     assert set(new_members_per_asset) == set(members_per_asset)
     assert set(m for s in members_per_asset.values() for m in s) == (
@@ -59,48 +178,20 @@ def remove_recursivity_from_tree(
     return new_members_per_asset, removed_links
 
 
-def _filter_autnum(
+def _start_filter_autnum(
     as_set: str,
     allowed_autnum: Set[str],
     original_members_per_asset: Dict[str, Set[str]],
-    new_members_per_asset: Dict[str, Set[str]],
-    visited_assets: Set[str],
-    parents: Set[str],
-):
-    # if as_set is already in new_members_per_asset, we dont need to do anything
-    if as_set in visited_assets:
-        return
-    if as_set in new_members_per_asset:
-        return
-    visited_assets.add(as_set)
-    new_members = set()
-    new_parents = set(parents)
-    new_parents.add(as_set)
-    for member in sorted(original_members_per_asset[as_set]):
-        # I am not sure what to do with parents. I will assume that
-        # we will removing this level of recursivity
-        if member in parents:
-            continue
-        # deal with autnum
-        if "-" not in member:
-            if member in allowed_autnum:
-                new_members.add(member)
-            continue
-        if member not in visited_assets:
-            # we need to process it
-            _filter_autnum(
-                member,
-                allowed_autnum,
-                original_members_per_asset,
-                new_members_per_asset,
-                visited_assets,
-                new_parents,
-            )
-        if member in new_members_per_asset:
-            new_members.add(member)
-            continue
-    if new_members:
-        new_members_per_asset[as_set] = new_members
+) -> Tuple[str, Set[str], Iterator[str]]:
+    """
+    Returns the stack element of filter_autnum for the as-set: the as-set,
+    its allowed autnum (the new members) and its as-set members (sorted)
+    """
+    as_set_members, autnum_members = _split_members(original_members_per_asset[as_set])
+    # deal with autnum, their order does not matter
+    new_members = {member for member in autnum_members if member in allowed_autnum}
+    as_set_members.sort()
+    return as_set, new_members, iter(as_set_members)
 
 
 def filter_autnum(
@@ -108,34 +199,54 @@ def filter_autnum(
     allowed_autnum: Set[str],
     original_members_per_asset: Dict[str, Set[str]],
 ) -> Dict[str, Set[str]]:
+    """
+    Returns the members per as-set with only the allowed autnum, and the
+    as-sets with members left. The tree is traversed depth first with an
+    explicit stack, each as-set is expanded only once.
+    """
     new_members_per_asset: Dict[str, Set[str]] = {}
-    _filter_autnum(
-        root_asset,
-        allowed_autnum,
-        original_members_per_asset,
-        new_members_per_asset,
-        set(),
-        set(),
-    )
+    visited_assets: Set[str] = {root_asset}
+    in_path: Set[str] = {root_asset}
+    stack: List[Tuple[str, Set[str], Iterator[str]]] = [
+        _start_filter_autnum(root_asset, allowed_autnum, original_members_per_asset)
+    ]
+    while stack:
+        as_set, new_members, members = stack[-1]
+        for member in members:
+            # I am not sure what to do with parents. I will assume that
+            # we will removing this level of recursivity
+            if member in in_path:
+                continue
+            if member not in visited_assets:
+                # we need to process it, and come back to this as-set later
+                visited_assets.add(member)
+                in_path.add(member)
+                stack.append(
+                    _start_filter_autnum(
+                        member, allowed_autnum, original_members_per_asset
+                    )
+                )
+                break
+            if member in new_members_per_asset:
+                new_members.add(member)
+        else:
+            stack.pop()
+            in_path.discard(as_set)
+            if new_members:
+                new_members_per_asset[as_set] = new_members
+                if stack:
+                    stack[-1][1].add(as_set)
     return new_members_per_asset
 
 
-def get_origin_asns(
-    as_set: str,
-    origin_ases_per_asset: Dict[str, FrozenSet[str]],
-    as_sets_members: Dict[str, Set[str]],
-    parents: List[str],
-    recursive_as_sets: Dict[str, Set[str]],
-) -> Tuple[Optional[str], FrozenSet[str]]:
+def get_origin_asn_masks(
+    root_as_set: str, members_per_asset: Dict[str, Set[str]]
+) -> Tuple[Dict[str, int], List[str]]:
     """
-    Finds all  AUT-NUM  under AS-SET (called origin_ases) from a list of
-    as_sets_members (not only directly but under the hierarchy)
+    Finds all  AUT-NUM  under each AS-SET (called origin_ases) under the root
+    (not only directly but under the hierarchy).
 
-    Populates origin_ases_per_asset with the set of origin_ases for each as-set.
-
-    Recursive, returns the recursive parent, if any, and the Set of origin ASes
-    for this as-set without recursion.
-    The main problem is that recursivity can be on different levels, so
+    The main problem is recursivity, which can be on different levels, so
     something like this is possible
     AS-1
      AS-2
@@ -146,142 +257,221 @@ def get_origin_asns(
       AS-4
        AS-1
        AS6
-    So we go over the members, keep the recursiveness in recursive_as_sets and when
-    we resolve it, we assign the same data to the recursive children
-    """
-    # if the as-set is already in the db, return
-    if as_set in origin_ases_per_asset:
-        return None, origin_ases_per_asset[as_set]
-
-    # nr_ means no recursive
-    nr_origin_asns: Set[str] = set()
-    new_parents = parents + [as_set]
-
-    # the complication here is that we can have different recursiveness.
-    # the as-set can reference itself directly
-    # the as-set can be referenced in one of the children.
-    recursive_parent = None
-    for member in as_sets_members[as_set]:
-        if member == as_set:
-            # member is the same as_set, skipping then
-            continue
-        if member in parents:
-            # the member is one of the parents. Set the highest one as the
-            # recursive parent
-            if recursive_parent is None:
-                recursive_parent = member
+    The as-sets in a loop (AS-1, AS-2, AS-3 and AS-4 here) are a strongly
+    connected component and share the same origin_ases. The components are found
+    with (an iterative version of) Tarjan's algorithm, which completes each one
+    after the components under it, so each as-set is traversed only once.
+    The origin_ases are returned as int bitmasks over the autnums (see
+    get_bit), together with the autnum of each bit.
+    """
+    bit_per_autnum: Dict[str, int] = {}
+    autnum_per_bit: List[str] = []
+    origin_mask_per_asset: Dict[str, int] = {}
+
+    # the position where each as-set was found, and the lowest position of an
+    # as-set in the component stack reachable from it
+    index_per_asset: Dict[str, int] = {root_as_set: 0}
+    lowlink_per_asset: Dict[str, int] = {root_as_set: 0}
+    # as-sets whose component is not complete yet, with their as-set members
+    # and autnum members (classified once, when the as-set is found)
+    component_stack: List[str] = [root_as_set]
+    in_component_stack: Set[str] = {root_as_set}
+    split_members_per_asset: Dict[str, Tuple[List[str], List[str]]] = {
+        root_as_set: _split_members(members_per_asset[root_as_set])
+    }
+
+    stack: List[Tuple[str, Iterator[str]]] = [
+        (root_as_set, iter(split_members_per_asset[root_as_set][0]))
+    ]
+    while stack:
+        as_set, members = stack[-1]
+        for member in members:
+            if member == as_set:
+                continue
+            if member not in index_per_asset:
+                # first time we find the member, we visit it and come back
+                index = len(index_per_asset)
+                index_per_asset[member] = index
+                lowlink_per_asset[member] = index
+                component_stack.append(member)
+                in_component_stack.add(member)
+                split_members = _split_members(members_per_asset[member])
+                split_members_per_asset[member] = split_members
+                stack.append((member, iter(split_members[0])))
+                break
+            if member in in_component_stack:
+                if index_per_asset[member] < lowlink_per_asset[as_set]:
+                    lowlink_per_asset[as_set] = index_per_asset[member]
+        else:
+            stack.pop()
+            if stack:
+                parent = stack[-1][0]
+                if lowlink_per_asset[as_set] < lowlink_per_asset[parent]:
+                    lowlink_per_asset[parent] = lowlink_per_asset[as_set]
+            if lowlink_per_asset[as_set] != index_per_asset[as_set]:
                 continue
-            # we cannot have multiple parents, so even if there is redundancy
-            # of two, we just pick the highest (i.e. the closest to the top)
-            if parents.index(member) < parents.index(recursive_parent):
-                recursive_parent = member
-            continue
-
-        # as-sets without a -, e.g. AS123, is an origin ases, add it to the
-        # nr_origin_asns of this as-set
-        if "-" not in member:
-            nr_origin_asns.add(member)
-            continue
-        # we now go recursively to process the as-set member. We will get the
-        # original ases of this as, and whether the member has a recursive
-        # parent
-        this_member_recursive_parent, member_origin_asns = get_origin_asns(
-            member,
-            origin_ases_per_asset,
-            as_sets_members,
-            new_parents,
-            recursive_as_sets,
-        )
 
-        # we extend the origin asnes with the ones of the children
-        nr_origin_asns |= member_origin_asns
-
-        # now we deal with the recursive parent of a member.
-        # if it exists and the recusive parent is larger than the one we have
-        # found already, we
-        # update it and continue
-
-        if this_member_recursive_parent is None:
-            continue
-        # now we have to change the recursive father if higher
-        if this_member_recursive_parent == as_set:
-            continue
-        if this_member_recursive_parent not in parents:
-            raise Exception(
-                "we got a recursive parent for a child, that we dont have.."
-            )
-        if recursive_parent is None:
-            recursive_parent = this_member_recursive_parent
-            continue
-        if parents.index(this_member_recursive_parent) < parents.index(
-            recursive_parent
-        ):
-            recursive_parent = this_member_recursive_parent
-
-    # if the as-set member has a recursive parent, we dont add them to the db
-    # yet.
-    # we add it to recursive_as_sets, which keeps the children for each parent
-    # as-set
-    # but then, if the as-set has children we need to move them to the
-    # recursive_parent set.
-    if recursive_parent:
-        # we cannot assign the definitve origin_asns yet,
-        # but, we have to deal with multiple recursiveness
-        recursive_as_sets.setdefault(recursive_parent, set()).add(as_set)
-        if as_set in recursive_as_sets:
-            # we move the chidlren to the recursive_parent set, adn remove this
-            # as-set  from recursive_parent
-            for child_as_set_referencing_parent in recursive_as_sets[as_set]:
-                recursive_as_sets.setdefault(recursive_parent, set()).add(
-                    child_as_set_referencing_parent
+            # as_set is the first as-set of its component, which is complete
+            component_member = component_stack.pop()
+            in_component_stack.discard(component_member)
+            if component_member == as_set:
+                # a component of a single as-set (no recursivity), the
+                # common case
+                as_set_members, autnum_members = split_members_per_asset.pop(as_set)
+                origin_mask = to_bitmask(autnum_members, bit_per_autnum, autnum_per_bit)
+                for member in as_set_members:
+                    origin_mask |= origin_mask_per_asset.get(member, 0)
+                origin_mask_per_asset[as_set] = origin_mask
+                continue
+            component: List[str] = [component_member]
+            while component_member != as_set:
+                component_member = component_stack.pop()
+                in_component_stack.discard(component_member)
+                component.append(component_member)
+            origin_mask = 0
+            for component_member in component:
+                as_set_members, autnum_members = split_members_per_asset.pop(
+                    component_member
                 )
-            del recursive_as_sets[as_set]
-    else:
-        # if we are resolved, then the nr_origin_asns are the same origin_asns
-        # and we can set the children with the right set
-        origin_ases_per_asset[as_set] = frozenset(nr_origin_asns)
-        if as_set in recursive_as_sets:
-            for child_as_set_referencing_parent in recursive_as_sets[as_set]:
-                origin_ases_per_asset[
-                    child_as_set_referencing_parent
-                ] = origin_ases_per_asset[as_set]
-            del recursive_as_sets[as_set]
-
-    return recursive_parent, frozenset(nr_origin_asns)
-
-
-def get_origin_asns_from_members(
+                origin_mask |= to_bitmask(
+                    autnum_members, bit_per_autnum, autnum_per_bit
+                )
+                for member in as_set_members:
+                    # the members out of the component are already completed
+                    origin_mask |= origin_mask_per_asset.get(member, 0)
+            for component_member in component:
+                origin_mask_per_asset[component_member] = origin_mask
+    return origin_mask_per_asset, autnum_per_bit
+
+
+def get_origin_asns_per_asset(
     root_as_set: str, members_per_asset: Dict[str, Set[str]]
 ) -> Dict[str, FrozenSet[str]]:
+    """
+    Finds all  AUT-NUM  under each AS-SET (called origin_ases) under the root
+    (not only directly but under the hierarchy), see get_origin_asn_masks.
+    """
+    origin_mask_per_asset, autnum_per_bit = get_origin_asn_masks(
+        root_as_set, members_per_asset
+    )
+    # as-sets with the same origin_ases share the set
+    origin_ases_per_mask: Dict[int, FrozenSet[str]] = {}
+    origin_ases_per_asset: Dict[str, FrozenSet[str]] = {}
+    for as_set, origin_mask in origin_mask_per_asset.items():
+        origin_ases = origin_ases_per_mask.get(origin_mask)
+        if origin_ases is None:
+            origin_ases = from_bitmask(origin_mask, autnum_per_bit)
+            origin_ases_per_mask[origin_mask] = origin_ases
+        origin_ases_per_asset[as_set] = origin_ases
+    return origin_ases_per_asset
+
+
+def get_origin_asn_masks_from_members(
+    root_as_set: str, members_per_asset: Dict[str, Set[str]]
+) -> Tuple[Dict[str, int], List[str]]:
     """
     We can pre-calculate the origin_asns for each as-set by traversing the
-    tree
+    tree. They are returned as bitmasks, see get_origin_asn_masks.
     TODO: We could use the irrserver to get the same data. This is what the
     original irrtree does.
     """
 
-    origin_ases_per_asset: Dict[str, FrozenSet[str]] = {}
-
-    recursive_as_sets: Dict[str, Set[str]] = {}
-    rp, _ = get_origin_asns(
-        root_as_set,
-        origin_ases_per_asset,
-        members_per_asset,
-        parents=[],
-        recursive_as_sets=recursive_as_sets,
+    origin_mask_per_asset, origin_asn_per_bit = get_origin_asn_masks(
+        root_as_set, members_per_asset
     )
 
-    # we need to double check the process did not fail (it is, after all, the
-    # most complex process)
-    assert rp is None, "The parent tree depends on a as-set that is not included"
-    assert (
-        not recursive_as_sets
-    ), "Internal error: The recursive_as_sets contains unmanaged recursive as_sets"
-    assert set(origin_ases_per_asset) == set(
+    # we need to double check the process did not fail
+    assert set(origin_mask_per_asset) == set(
         members_per_asset
     ), "we did not find the origin ases for all as-sets on the tree"
 
-    return origin_ases_per_asset
+    return origin_mask_per_asset, origin_asn_per_bit
+
+
+def get_base_origin_masks(
+    assets_per_origin_mask: Dict[int, List[str]],
+    origin_mask_per_asset: Dict[str, int],
+    members_per_asset: Dict[str, Set[str]],
+) -> Tuple[List[int], Dict[int, int]]:
+    """
+    Returns the origin masks (see get_origin_asn_masks) in the order they can
+    be built, and the base of each one.
+    The origin masks of the as-set members of an as-set are subsets of its
+    own, so the values of each origin mask (like its prefixes) can be built
+    from the ones of the largest origin mask of its members (its base, 0 if
+    there is none), adding only the remaining origin asns. The base of an
+    origin mask is a strict subset, so it has less origin asns and it is
+    built before.
+    """
+    number_origin_asns_per_mask: Dict[int, int] = {
+        origin_mask: bin(origin_mask).count("1")
+        for origin_mask in assets_per_origin_mask
+    }
+    base_mask_per_mask: Dict[int, int] = {}
+    for origin_mask, assets in assets_per_origin_mask.items():
+        base_mask = 0
+        base_number_origin_asns = 0
+        for asset in assets:
+            for member in members_per_asset[asset]:
+                member_mask = origin_mask_per_asset.get(member)
+                if member_mask is None or member_mask == origin_mask:
+                    continue
+                if number_origin_asns_per_mask[member_mask] > base_number_origin_asns:
+                    base_mask = member_mask
+                    base_number_origin_asns = number_origin_asns_per_mask[member_mask]
+        base_mask_per_mask[origin_mask] = base_mask
+    build_order = sorted(
+        assets_per_origin_mask, key=number_origin_asns_per_mask.__getitem__
+    )
+    return build_order, base_mask_per_mask
+
+
+def _number_prefixes_per_origin_mask(
+    assets_per_origin_mask: Dict[int, List[str]],
+    origin_mask_per_asset: Dict[str, int],
+    members_per_asset: Dict[str, Set[str]],
+    origin_asn_per_bit: List[str],
+    prefixes_per_autun: Dict[str, Set[str]],
+) -> Dict[int, int]:
+    """
+    Calculates the number of prefixes of each origin mask (see
+    get_origin_asn_masks).
+    The prefixes of each origin mask are built from the prefixes of its base
+    (see get_base_origin_masks). The prefix sets are kept only while other
+    origin masks are pending to be built from them.
+    """
+    build_order, base_mask_per_mask = get_base_origin_masks(
+        assets_per_origin_mask, origin_mask_per_asset, members_per_asset
+    )
+    pending_uses_per_mask: Dict[int, int] = {}
+    for base_mask in base_mask_per_mask.values():
+        if base_mask:
+            pending_uses_per_mask[base_mask] = (
+                pending_uses_per_mask.get(base_mask, 0) + 1
+            )
+
+    number_prefixes_per_mask: Dict[int, int] = {}
+    prefixes_per_mask: Dict[int, Set[str]] = {}
+    for origin_mask in build_order:
+        base_mask = base_mask_per_mask[origin_mask]
+        this_prefix_set: Set[str]
+        if not base_mask:
+            this_prefix_set = set()
+        else:
+            pending_uses_per_mask[base_mask] -= 1
+            if pending_uses_per_mask[base_mask]:
+                this_prefix_set = set(prefixes_per_mask[base_mask])
+            else:
+                # last use of the base, we can take its set
+                this_prefix_set = prefixes_per_mask.pop(base_mask)
+        for asn_origin in iter_bitmask(origin_mask & ~base_mask, origin_asn_per_bit):
+            if asn_origin not in prefixes_per_autun:
+                raise Exception(f"We did not preload prefixes for {asn_origin}")
+            this_prefix_set |= prefixes_per_autun[asn_origin]
+        number_prefixes_per_mask[origin_mask] = len(this_prefix_set)
+        if pending_uses_per_mask.get(origin_mask):
+            prefixes_per_mask[origin_mask] = this_prefix_set
+    return number_prefixes_per_mask
 
 
 async def irrtree_process(
@@ -290,16 +480,20 @@ async def irrtree_process(
     irr_treeoptions: IRRAsciiTreeOptions,
     debug: bool,
     disable_progress_bar: bool,
-) -> str:
+) -> Iterator[str]:
+    """
+    Queries the IRR server and returns the lines of the irrtree report
+    """
     query_object = root_as_set
-    queue: asyncio.Queue = asyncio.Queue()
+    queue = SimpleQueue()
 
-    # start workers, this actually establishes the session.
-    workers = []
-    for n in range(0, irr_server_options.workers):
-        worker = Worker(n, irr_server_options, queue)
-        await worker.initialize()
-        workers.append(worker)
+    # start workers, this actually establishes the session. The sessions are
+    # established concurrently, and kept for all the queries of the run.
+    workers = [
+        Worker(n, irr_server_options, queue)
+        for n in range(0, irr_server_options.workers)
+    ]
+    await asyncio.gather(*(worker.initialize() for worker in workers))
 
     # The irrtree process means
     # Obtains the irrtree based on the parameters. They contain soruces, filters, AFI
@@ -307,7 +501,7 @@ async def irrtree_process(
 
     # get tree
     queue.put_nowait(query_object)
-    visited = set([query_object])
+    visited = {query_object}
     pbar = None
     if not disable_progress_bar:
         widgets = [
@@ -342,7 +536,7 @@ async def irrtree_process(
     try:
         await join_queue_or_workers(queue, worker_runs)
     except Exception as e:
-        LOGGER.error("Got an exception getting tree", exc_info=task.exception())
+        LOGGER.error("Got an exception getting tree", exc_info=e)
         raise e
 
     if pbar:
@@ -352,7 +546,7 @@ async def irrtree_process(
     # if search is set, modify the members.
     if irr_server_options.search:
         members_per_asset = filter_autnum(
-            query_object, set([irr_server_options.search]), members_per_asset
+            query_object, {irr_server_options.search}, members_per_asset
         )
 
     # we process the irrtree (remove edges, for instances in loops, even add
@@ -376,6 +570,28 @@ async def irrtree_process(
                 continue
             asn_objects.add(member)
 
+    # the prefixes found in the cache are not resolved again
+    prefixes_per_autun: Dict[str, Set[str]] = {}
+    prefix_cache = irr_server_options.prefix_cache
+    if prefix_cache:
+        # the cache only saves queries, if it fails all the prefixes are queried
+        try:
+            prefixes_per_autun = load_cached_prefixes(
+                prefix_cache,
+                asn_objects,
+                irr_server_options.irr_host,
+                irr_server_options.irr_port,
+                irr_server_options.sources_list,
+                irr_server_options.afi,
+                irr_server_options.prefix_cache_ttl,
+            )
+        except (sqlite3.Error, OSError) as e:
+            LOGGER.warning(
+                f"Could not load the prefix cache {prefix_cache}", exc_info=e
+            )
+        LOGGER.info(f"Found {len(prefixes_per_autun)} aut-num in the prefix cache")
+        asn_objects.difference_update(prefixes_per_autun)
+
     pbar = None
     if not disable_progress_bar:
         widgets = [
@@ -393,8 +609,6 @@ async def irrtree_process(
     for autnum in asn_objects:
         queue.put_nowait(autnum)
 
-    prefixes_per_autun: Dict[str, Set[str]] = {}
-
     worker_runs = {}
     for worker in workers:
         task = asyncio.create_task(
@@ -408,7 +622,7 @@ async def irrtree_process(
     try:
         await join_queue_or_workers(queue, worker_runs)
     except Exception as e:
-        LOGGER.error("Got an exception getting tree", exc_info=task.exception())
+        LOGGER.error("Got an exception resolving prefixes", exc_info=e)
         raise e
 
     if pbar:
@@ -419,31 +633,49 @@ async def irrtree_process(
     for w in workers:
         await w.terminate()
 
-    origin_ases_per_asset: Dict[str, FrozenSet[str]] = get_origin_asns_from_members(
+    if prefix_cache:
+        # a failure storing the prefixes does not stop the report
+        try:
+            store_prefixes(
+                prefix_cache,
+                {autnum: prefixes_per_autun[autnum] for autnum in asn_objects},
+                irr_server_options.irr_host,
+                irr_server_options.irr_port,
+                irr_server_options.sources_list,
+                irr_server_options.afi,
+            )
+        except (sqlite3.Error, OSError) as e:
+            LOGGER.warning(
+                f"Could not store the prefix cache {prefix_cache}", exc_info=e
+            )
+
+    origin_mask_per_asset, origin_asn_per_bit = get_origin_asn_masks_from_members(
         root_as_set, members_per_asset
     )
 
     # We can now calculate the irrtree ascii data.
     # We will calculate the number of prefixes per as-set, in recursive cases
-    # many as-sets share the same set of origin_ases_per_asset, so we will
-    # calcualte them from there.
-    # the current algorithm would work better for recursive cases
-    # TODO: Find a way of reuse sets to speed up the process
-    assets_per_origin_as_set: Dict[FrozenSet[str], Set[str]] = {}
-    for asset, origin_as_set in origin_ases_per_asset.items():
-        assets_per_origin_as_set.setdefault(origin_as_set, set()).add(asset)
-
+    # many as-sets share the same origin_ases, so we will calcualte them once
+    # per origin_ases. These are kept as bitmasks (see get_origin_asn_masks).
+    assets_per_origin_mask: Dict[int, List[str]] = {}
+    for asset, origin_mask in origin_mask_per_asset.items():
+        assets_per_origin_mask.setdefault(origin_mask, []).append(asset)
+
+    number_prefixes_per_origin_mask = _number_prefixes_per_origin_mask(
+        assets_per_origin_mask,
+        origin_mask_per_asset,
+        members_per_asset,
+        origin_asn_per_bit,
+        prefixes_per_autun,
+    )
     number_prefixes_per_asset: Dict[str, int] = {}
     number_origin_asn_per_asset: Dict[str, int] = {}
-    for origin_as_set, assets in assets_per_origin_as_set.items():
-        this_prefix_set = set()
-        for asn_origin in origin_as_set:
-            if asn_origin not in prefixes_per_autun:
-                raise Exception(f"We did not preload prefixes for {asn_origin}")
-            this_prefix_set |= prefixes_per_autun[asn_origin]
+    for origin_mask, assets in assets_per_origin_mask.items():
+        number_prefixes = number_prefixes_per_origin_mask[origin_mask]
+        number_origin_asns = bin(origin_mask).count("1")
         for asset in assets:
-            number_prefixes_per_asset[asset] = len(this_prefix_set)
-            number_origin_asn_per_asset[asset] = len(origin_as_set)
+            number_prefixes_per_asset[asset] = number_prefixes
+            number_origin_asn_per_asset[asset] = number_origin_asns
 
     # The number of prefixes per asn are taken directly from their sets
     number_prefixes_per_asn: Dict[str, int] = {}
@@ -461,6 +693,5 @@ async def irrtree_process(
         number_prefixes_per_asset=number_prefixes_per_asset,
     )
 
-    ascii_tree = print_asset_tree(ascii_data, irr_server_options, irr_treeoptions)
-
-    return ascii_tree
+    # the report is drawn while its lines are written
+    return iter_asset_tree(ascii_data, irr_server_options, irr_treeoptions)
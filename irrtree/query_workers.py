@@ -1,11 +1,12 @@
 import logging
 import asyncio
-from typing import Set, Dict, Optional
+import sys
+from collections import deque
+from typing import Set, Dict, Iterable, List, Optional, Deque
 
 import progressbar
 from irrtree.datamodels import (
-    re_asn,
-    re_as_set,
+    re_asn_or_as_set,
     is_as_set,
     IRRServerOptions,
 )
@@ -13,6 +14,60 @@ from irrtree.datamodels import (
 LOGGER = logging.getLogger()
 
 
+class SimpleQueue:
+    """
+    A queue of objects for the workers, with the part of the interface of
+    asyncio.Queue they use (get, get_nowait, put_nowait, empty, task_done
+    and join).
+    The workers run in the same event loop, so the objects are kept in a
+    deque, and only the consumers of an empty queue wait (for an event).
+    """
+
+    def __init__(self) -> None:
+        self._items: Deque[str] = deque()
+        self._not_empty = asyncio.Event()
+        self._unfinished_tasks = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def put_nowait(self, item: str) -> None:
+        self._items.append(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._not_empty.set()
+
+    def get_nowait(self) -> str:
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item = self._items.popleft()
+        if not self._items:
+            self._not_empty.clear()
+        return item
+
+    async def get(self) -> str:
+        # many consumers can wake up for a single object, the ones finding
+        # the queue empty wait again
+        while not self._items:
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def task_done(self) -> None:
+        if self._unfinished_tasks <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished_tasks -= 1
+        if not self._unfinished_tasks:
+            self._finished.set()
+
+    async def join(self) -> None:
+        await self._finished.wait()
+
+
 class Worker:
     """
     A Worker keeps a connection towards the irrd server and performs queries
@@ -23,7 +78,7 @@ class Worker:
         self,
         worker_id: int,
         server: IRRServerOptions,
-        queue: asyncio.Queue,
+        queue: SimpleQueue,
     ):
         self.queue = queue
         self.irr_host = server.irr_host
@@ -47,7 +102,7 @@ class Worker:
         self.reader, self.writer = await asyncio.open_connection(
             self.irr_host, self.irr_port, limit=3 * 1024 * 1024
         )
-        await self.send("!!")
+        self.send_no_drain("!!")
         await self.send("!t1000")  # instruct irrd to set max timeout (1000s)
         await self.receive()  # silently ignore result
         if sources_list:
@@ -64,12 +119,21 @@ class Worker:
         self.writer.close()
         # await self.writer.wait_closed()
 
-    async def send(self, command: str) -> None:
+    def send_no_drain(self, command: str) -> None:
+        """
+        Writes the command without waiting for it to be sent, see flush
+        """
         self.debug(f"sending: {command}")
         msg = command + "\r\n"
         self.writer.write(msg.encode())
+
+    async def flush(self) -> None:
         await self.writer.drain()
 
+    async def send(self, command: str) -> None:
+        self.send_no_drain(command)
+        await self.flush()
+
     async def restart(self) -> None:
         """
         Restarts the connection
@@ -86,6 +150,21 @@ class Worker:
         line = await self.reader.readline()
         return line.decode()[:-1]
 
+    async def handle_eof(self) -> None:
+        """
+        Restarts the connection after an EOF, if possible.
+        """
+        # According to https://docs.python.org/3/library/asyncio-stream.html
+        # this is an EOF. Restart the connection if possible
+        self.restarts = self.restarts - 1
+        if self.restarts < 0:
+            raise Exception("We got to the limit of restarts, failing")
+        self.warning("We got an EOF from socket. Restarting connection ")
+        try:
+            await self.restart()
+        except Exception as e:
+            raise Exception("Failed restarting connection.") from e
+
     async def send_and_receive(self, command: str) -> str:
         """
         Sends a command and receives. Streams should have been initialized..
@@ -95,19 +174,14 @@ class Worker:
             await self.send(command)
             response = await self.receive()
             if not response:
-                # According to https://docs.python.org/3/library/asyncio-stream.html
-                # this is an EOF. Restart the connection if possible
-                self.restarts = self.restarts - 1
-                if self.restarts < 0:
-                    raise Exception("We got to the limit of restarts, failing")
-                self.warning("We got an EOF from socket. Restarting connection ")
-                try:
-                    await self.restart()
-                except Exception as e:
-                    raise Exception("Failed restarting connection.") from e
+                await self.handle_eof()
                 continue
             return response
 
+    @staticmethod
+    def build_query(cmd: str, as_set: str, recurse=False) -> str:
+        return "!%s%s%s" % (cmd, as_set, ",1" if recurse else "")
+
     async def query(self, cmd: str, as_set: str, recurse=False) -> Set[str]:
         """
         Queries the server and returns a set of objects.
@@ -118,10 +192,66 @@ class Worker:
         TODO: It does not differentiate between errors (F), non-existence (D),
         empty sets (Single C).
         """
-        query = "!%s%s%s" % (cmd, as_set, ",1" if recurse else "")
-        # receive the first line, we should conform to the response operation result.
-        # see https://irrd.readthedocs.io/en/stable/users/queries/whois/
+        query = self.build_query(cmd, as_set, recurse)
         answer = await self.send_and_receive(query)
+        return await self.receive_query_result(query, answer)
+
+    async def query_many(
+        self, cmd: str, as_sets: List[str], recurse=False
+    ) -> List[Set[str]]:
+        """
+        Same as query, for many objects. The queries are sent back to back,
+        and then their answers are read (in the same order), so there is a
+        single round-trip to the server.
+        On an EOF (or a connection error), the connection is restarted and the
+        queries without an answer are sent again.
+        """
+        queries = [self.build_query(cmd, as_set, recurse) for as_set in as_sets]
+        results: List[Set[str]] = []
+        while len(results) < len(queries):
+            pending_queries = queries[len(results) :]
+            try:
+                for query in pending_queries:
+                    self.send_no_drain(query)
+                await self.flush()
+                for query in pending_queries:
+                    answer = await self.receive()
+                    if not answer:
+                        break
+                    results.append(await self.receive_query_result(query, answer))
+            except ConnectionError as e:
+                # with queries still unread by the server, closing the
+                # connection resets it instead of sending an EOF
+                self.warning(f"Got a connection error: {e!r}")
+            if len(results) < len(queries):
+                await self.handle_eof()
+        return results
+
+    async def receive_payload(self, answer: str) -> bytes:
+        """
+        Receives the payload of an A answer. The answer has the length of the
+        payload (with its newline), so it is read at once instead of
+        scanning it for the newline.
+        """
+        length = answer[1:]
+        if not length.isdigit():
+            return await self.reader.readline()
+        try:
+            payload = await self.reader.readexactly(int(length))
+        except asyncio.IncompleteReadError as e:
+            # same as readline, which returns the partial data on an EOF
+            return e.partial
+        if not payload.endswith(b"\n"):
+            # the length did not include the newline
+            payload += await self.reader.readline()
+        return payload
+
+    async def receive_query_result(self, query: str, answer: str) -> Set[str]:
+        """
+        Receives the result of the query, after its first answer line.
+        """
+        # the first line should conform to the response operation result.
+        # see https://irrd.readthedocs.io/en/stable/users/queries/whois/
         if answer == "D":
             return set()
         elif answer[0] == "F":
@@ -132,8 +262,10 @@ class Worker:
             )
         elif answer[0] == "A":
             self.debug("Info: receiving %s bytes" % answer[1:])
-            unfiltered_value = await self.receive()
-            results = set(unfiltered_value.split())
+            # the objects are split directly from the payload as read (split
+            # ignores the newline), so it is not copied again
+            payload = await self.receive_payload(answer)
+            results = set(payload.decode().split())
 
             # An A closes with a C
             close_return = await self.receive()
@@ -141,25 +273,59 @@ class Worker:
                 self.warning(
                     "Error: something went wrong with: %s. Not closing with C" % query
                 )
-            return set(results)
+            return results
         else:
             self.warning(f"Response for query not processed. Query is {query}")
             return set()
 
-    async def get_members(self, as_set: str, recurse: bool = False) -> Set[str]:
+    @staticmethod
+    def check_as_set(as_set: str) -> None:
         if not is_as_set(as_set):
             raise Exception(
                 f"Trying to get members from {as_set} which does not look like an"
                 " as-set"
             )
+
+    async def get_members(
+        self,
+        as_set: str,
+        recurse: bool = False,
+        filtered_as_sets: Optional[Set[str]] = None,
+        check_as_set: bool = True,
+    ) -> Set[str]:
+        """
+        Returns the members of the as-set, leaving out the ones in
+        filtered_as_sets (checked while validating them).
+        The check of the as-set can be skipped for the ones that come from
+        members (which are validated here).
+        """
+        if check_as_set:
+            self.check_as_set(as_set)
         unfiltered_members = await self.query("i", as_set, recurse=recurse)
+        return self.validate_members(as_set, unfiltered_members, filtered_as_sets)
+
+    def validate_members(
+        self,
+        as_set: str,
+        unfiltered_members: Iterable[str],
+        filtered_as_sets: Optional[Set[str]] = None,
+    ) -> Set[str]:
+        """
+        Returns the valid members of the as-set answered by the server,
+        leaving out the ones in filtered_as_sets.
+        """
         members = set()
+        # the names are interned, they repeat across the members of many as-sets
+        match_member = re_asn_or_as_set.match
+        filtered: Set[str] = filtered_as_sets or set()
         for result in unfiltered_members:
-            # Run data validation on the member objects.
-            if re_asn.match(result):
-                members.add(result.upper())  # found an autnum or hierarchical as-set
-            elif re_as_set.match(result):
-                members.add(result.upper())  # found a simple as-set
+            # Run data validation on the member objects. We found an autnum,
+            # a hierarchical as-set or a simple as-set
+            if match_member(result):
+                member = sys.intern(result.upper())
+                if filtered and member in filtered:
+                    continue
+                members.add(member)
             else:
                 self.warning(
                     "Warning: not honoring mbrs-by-ref for object %s with '%s'"
@@ -194,39 +360,64 @@ class Worker:
                 "The starting visited set is empty but should contain at least the root"
                 " as-set"
             )
+        # the as-sets put in the queue here come from validated members, which
+        # look like as-sets (they have a "-"), so only the starting ones are
+        # checked
+        for as_set in visited:
+            self.check_as_set(as_set)
 
+        pipelined_queries = self.server.pipelined_queries
         while True:
-            # get an item and process it
-            item = await self.queue.get()
-            self.debug("Processing %s for members" % item)
-
-            if pbar:
-                pbar.increment()
+            # get an item, plus the ones already waiting in the queue (the
+            # queue is FIFO, so they are the rest of its layer of the tree),
+            # and query them together. They are interned, for the root, the
+            # only one not coming from members (which are already interned)
+            items = [sys.intern(await self.queue.get())]
+            while len(items) < pipelined_queries and not self.queue.empty():
+                items.append(sys.intern(self.queue.get_nowait()))
+
+            to_query: List[str] = []
+            for item in items:
+                self.debug("Processing %s for members" % item)
+
+                if pbar:
+                    pbar.increment()
+
+                if item in members_per_asset or item in to_query:
+                    self.warning(f"Reprocessing item {item}")
+                    # we need this if not, it will hang
+                    self.queue.task_done()
+                    continue
+                to_query.append(item)
 
-            if item in members_per_asset:
-                self.warning(f"Reprocessing item {item}")
-                # we need this if not, it will hang
-                self.queue.task_done()
+            if not to_query:
                 continue
 
-            # We get all members but filter those in filtered_as_sets
-            unfiltered_sets = await self.get_members(item)
-            members_per_asset[item] = set(
-                m for m in unfiltered_sets if m not in filtered_as_sets
-            )
+            all_unfiltered_members = await self.query_many("i", to_query, False)
 
-            # add the as-sets to process on the queue
-            for member in members_per_asset[item]:
-                # simple way of testing the members is an aut-num
-                if "-" not in member:
-                    continue
-                # if we already visited  or we already have the members, ignore
-                if member in visited or member in members_per_asset:
-                    continue
-                visited.add(member)
-                self.queue.put_nowait(member)
+            # the new as-sets are found locally, and the shared objects are
+            # updated at once (there are no awaits from here on).
+            for item, unfiltered_members in zip(to_query, all_unfiltered_members):
+                # We get all members but filter those in filtered_as_sets
+                members = self.validate_members(
+                    item, unfiltered_members, filtered_as_sets
+                )
 
-            self.queue.task_done()
+                # "-" is a simple way of testing the members is not an aut-num,
+                # if we already visited or we already have the members, ignore
+                new_as_sets = [
+                    member
+                    for member in members
+                    if "-" in member
+                    and member not in visited
+                    and member not in members_per_asset
+                ]
+                members_per_asset[item] = members
+                visited.update(new_as_sets)
+                for member in new_as_sets:
+                    self.queue.put_nowait(member)
+
+                self.queue.task_done()
 
     async def run_resolve_objects(
         self,
@@ -236,30 +427,40 @@ class Worker:
         if self.reader is None or self.writer is None:
             raise Exception("Worker not initialized, run worder.initialize() first")
 
+        pipelined_queries = self.server.pipelined_queries
         while True:
-            # get an item and process it
-            item = await self.queue.get()
-            self.debug("Resolving %s" % item)
-
-            if pbar:
-                pbar.increment()
-
-            # if it is an autnum, get the prefixes
-            if "-" in item:
-                raise Exception("Resolving as-sets is not yet implemented")
-
-            if item in prefixes_per_autun:
-                self.warning(f"Attempted repeated processing of {item}")
-                self.queue.task_done()
-                continue
-
-            prefixes = await self.query(
-                "g" if self.server.afi == 4 else "6", item, False
-            )
-
-            prefixes_per_autun[item] = prefixes
+            # get an item, plus the ones already waiting in the queue, and
+            # query them together
+            items = [await self.queue.get()]
+            while len(items) < pipelined_queries and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+
+            to_query: List[str] = []
+            for item in items:
+                self.debug("Resolving %s" % item)
+
+                if pbar:
+                    pbar.increment()
+
+                # if it is an autnum, get the prefixes
+                if "-" in item:
+                    raise Exception("Resolving as-sets is not yet implemented")
+
+                if item in prefixes_per_autun or item in to_query:
+                    self.warning(f"Attempted repeated processing of {item}")
+                    self.queue.task_done()
+                    continue
+                to_query.append(item)
 
-            self.queue.task_done()
+            if to_query:
+                all_prefixes = await self.query_many(
+                    "g" if self.server.afi == 4 else "6", to_query, False
+                )
+                # prefixes are interned, the ones with many origins are kept
+                # once, and the unions of prefix sets compare them by identity
+                for item, prefixes in zip(to_query, all_prefixes):
+                    prefixes_per_autun[item] = set(map(sys.intern, prefixes))
+                    self.queue.task_done()
 
     async def run_get_origin_asns(self, origin_asns: Dict[str, Set[str]]):
         if self.reader is None or self.writer is None:
@@ -285,7 +486,7 @@ class Worker:
 
 
 async def join_queue_or_workers(
-    queue: asyncio.Queue, worker_tasks: Dict[asyncio.Task, Worker]
+    queue: SimpleQueue, worker_tasks: Dict[asyncio.Task, Worker]
 ):
     """
     Waits for a queue to  finish, if one worker finishes sooner,
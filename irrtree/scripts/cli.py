@@ -26,23 +26,23 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
-import asyncio
 from typing import Optional
 from pathlib import Path
 import logging
 import sys
 
 import irrtree
-from irrtree.process_functions import irrtree_process
 from irrtree.datamodels import (
     is_as_set,
     IRRServerOptions,
 )
+from irrtree.irrtree_print import write_asset_tree
 from irrtree.args_functions import (
     validate_asn,
     validate_positive_int,
     add_args_for_tree_options,
     build_irr_treeoptions,
+    parse_asset_filters,
 )
 
 
@@ -53,6 +53,11 @@ logging.basicConfig(
     stream=sys.stderr,
 )
 LOGGER = logging.getLogger()
+# the format once the as-set and the afi are known, they are added to each
+# record as attributes (see add_log_context)
+CONTEXT_LOG_FORMATTER = logging.Formatter(
+    '%(asctime)s [%(levelname)s] {"AS-SET": "%(as_set)s", "AFI": %(afi)d} %(message)s'
+)
 
 
 parser = argparse.ArgumentParser(
@@ -85,6 +90,32 @@ parser.add_argument(
     help="Maximum number of restarts per connection. (default 3)",
 )
 
+parser.add_argument(
+    "--prefix_cache",
+    type=Path,
+    help=(
+        "File to cache the prefixes per autnum across runs (for the same"
+        " sources and afi). Cached prefixes are not queried again"
+    ),
+)
+
+parser.add_argument(
+    "--prefix_cache_ttl",
+    type=validate_positive_int,
+    default=24 * 3600,
+    help="Seconds the cached prefixes are valid. (default 86400)",
+)
+
+parser.add_argument(
+    "--pipelined_queries",
+    type=validate_positive_int,
+    default=10,
+    help=(
+        "Number of queries (for members or prefixes) sent back to back per"
+        " connection before reading their answers. (default 10)"
+    ),
+)
+
 # Mutually exclusive group for --ipv4 and --ipv6
 group = parser.add_mutually_exclusive_group()
 group.add_argument(
@@ -129,6 +160,22 @@ parser.add_argument(
 parser.add_argument("as_set", help="ASSET to query")
 
 
+def add_log_context(as_set: str, afi: int) -> None:
+    """
+    Adds the as-set and the afi to the records logged by the handlers of
+    LOGGER, and formats them with CONTEXT_LOG_FORMATTER
+    """
+    log_context = {"as_set": as_set, "afi": afi}
+
+    def add_context(record: logging.LogRecord) -> bool:
+        record.__dict__.update(log_context)
+        return True
+
+    for handler in LOGGER.handlers:
+        handler.addFilter(add_context)
+        handler.setFormatter(CONTEXT_LOG_FORMATTER)
+
+
 def main() -> None:
     args = parser.parse_args()
 
@@ -148,13 +195,7 @@ def main() -> None:
         afi = 6
 
     # Mofify logging format to add the as-set and the afi
-    for handler in LOGGER.handlers:
-        handler.setFormatter(
-            logging.Formatter(
-                f'%(asctime)s [%(levelname)s] {{"AS-SET": "{args.as_set}", "AFI":'
-                f" {afi}}} %(message)s"
-            )
-        )
+    add_log_context(root_as_set, afi)
 
     # Set file
     output_file: Optional[Path] = None
@@ -162,17 +203,7 @@ def main() -> None:
         output_file = Path(args.output_file)
 
     # deal with filtered as-sets
-    filters = set()
-    if args.asset_filters:
-        invalid = set()
-        for candidate_filter in args.asset_filters.split(","):
-            candidate_filter = candidate_filter.strip()
-            if not is_as_set(candidate_filter):
-                invalid.add(candidate_filter)
-                continue
-            filters.add(candidate_filter)
-        if invalid:
-            raise Exception(f"The next are not valid as-sets for filters: {invalid}")
+    filters = parse_asset_filters(args.asset_filters)
 
     irr_server_options = IRRServerOptions(
         irr_host=args.host,
@@ -180,10 +211,13 @@ def main() -> None:
         afi=afi,
         sources_list=args.sources,
         max_restarts=args.max_restarts,
+        pipelined_queries=args.pipelined_queries,
         workers=args.connections,
         filters=filters,
         search=args.search,
         remove_recursivity=args.remove_recursivity,
+        prefix_cache=args.prefix_cache,
+        prefix_cache_ttl=args.prefix_cache_ttl,
     )
 
     irr_treeoptions = build_irr_treeoptions(args)
@@ -191,6 +225,11 @@ def main() -> None:
     LOGGER.debug("irr_server_options: %s", irr_server_options)
     LOGGER.debug("irr_treeoptions: %s", irr_treeoptions)
 
+    # the async stack (and the query workers) is only needed to run the
+    # queries, so --help or --version do not import it
+    import asyncio
+    from irrtree.process_functions import irrtree_process
+
     try:
         irrtree_output = asyncio.run(
             irrtree_process(
@@ -205,15 +244,14 @@ def main() -> None:
         LOGGER.error("Exiting with unhandled exception", exc_info=e)
         raise
 
-    # print in screen if there is not output file
-    if output_file is None:
-        print(irrtree_output)
-    else:
-        try:
-            output_file.write_text(irrtree_output)
-        except Exception as e:
-            LOGGER.error("Error writting to file", exc_info=e)
-            raise
+    # print in screen if there is not output file. The lines are written as
+    # they are drawn, the full report is never built, so drawing and writing
+    # fail together.
+    try:
+        write_asset_tree(irrtree_output, output_file)
+    except Exception as e:
+        LOGGER.error("Error drawing or writing the irrtree report", exc_info=e)
+        raise
 
 
 if __name__ == "__main__":
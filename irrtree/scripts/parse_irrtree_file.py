@@ -1,25 +1,28 @@
 import logging
 from pathlib import Path
-from typing import Dict, Set, FrozenSet, Optional
-import copy
+from collections import defaultdict
+from typing import DefaultDict, Dict, Set, List, Optional
 import argparse
 import sys
 
 
 import irrtree
-from irrtree.irrtree_print import print_asset_tree
+from irrtree.irrtree_print import iter_asset_tree, write_asset_tree
 from irrtree.args_functions import (
     build_irr_treeoptions,
     add_args_for_tree_options,
     validate_asn,
+    parse_asset_filters,
 )
 from irrtree.process_functions import (
-    get_origin_asns_from_members,
+    get_origin_asn_masks_from_members,
+    get_base_origin_masks,
+    iter_bits,
     filter_autnum,
     remove_recursivity_from_tree,
 )
-from irrtree.datamodels import IRRAsciiTreeData, ASSetTree, IRRServerOptions, is_as_set
-from irrtree.irrtree_parser import parse_irrtree_return_irrasciitreedata
+from irrtree.datamodels import IRRAsciiTreeData, ASSetTree, IRRServerOptions
+from irrtree.irrtree_parser import parse_irrtree_lines_return_irrasciitreedata
 
 # The format will be modified later to add the as-set and the afi
 logging.basicConfig(
@@ -65,41 +68,70 @@ parser.add_argument(
 parser.add_argument("irrtree_file", type=Path, help="Path to file with irrtree run")
 
 
-def _filter_from_graph(
-    asset: str,
-    new_members: Dict[str, Set[str]],
-    base_members: Dict[str, Set[str]],
-    filtered: Set[str],
-    seen: Set[str],
-):
-    if asset in seen or asset in filtered:
-        return
-    seen.add(asset)
-    new_members[asset] = set()
-    for member in base_members[asset]:
-        if member in filtered:
-            continue
-        new_members[asset].add(member)
-        if "-" not in member:
-            # autnum
-            continue
-        new_members[asset].add(member)
-        _filter_from_graph(member, new_members, base_members, filtered, seen)
-
-
 def filter_from_graph(
     root_asset: str, base_members: Dict[str, Set[str]], filtered: Set[str]
 ) -> Dict[str, Set[str]]:
     """
     Excludes as-sets from an irrtree
     In cli.py, this is done while gathering the irrtree form the server.
+    The tree is traversed depth first with an explicit stack. The members of
+    the as-sets without filtered members are shared with base_members.
     """
     new_members: Dict[str, Set[str]] = {}
-    seen: Set[str] = set()
-    _filter_from_graph(root_asset, new_members, base_members, filtered, seen)
+    stack: List[str] = [root_asset]
+    while stack:
+        asset = stack.pop()
+        if asset in new_members or asset in filtered:
+            continue
+        members: Set[str] = set()
+        as_set_members: List[str] = []
+        for member in base_members[asset]:
+            if member in filtered:
+                continue
+            members.add(member)
+            if "-" in member:
+                as_set_members.append(member)
+        if len(members) == len(base_members[asset]):
+            members = base_members[asset]
+        new_members[asset] = members
+        # reversed, so they are visited in the same order as the members
+        stack.extend(reversed(as_set_members))
     return new_members
 
 
+def find_affected_assets(
+    new_members_per_asset: Dict[str, Set[str]], old_irrtree_data: IRRAsciiTreeData
+) -> Set[str]:
+    """
+    Returns the as-sets whose origin asns can differ from the old irrtree
+    data: the as-sets with different members (or without old numbers), and
+    all their ancestors.
+    """
+    old_members_per_asset = old_irrtree_data.as_set_tree.members_per_asset
+    parents_per_asset: Dict[str, List[str]] = {}
+    stack: List[str] = []
+    for asset, members in new_members_per_asset.items():
+        for member in members:
+            if "-" in member:
+                parents_per_asset.setdefault(member, []).append(asset)
+        # the members shared with the old tree are equal, checked by identity
+        old_members = old_members_per_asset.get(asset)
+        if (
+            (members is not old_members and members != old_members)
+            or asset not in old_irrtree_data.number_prefixes_per_asset
+            or asset not in old_irrtree_data.number_origin_asn_per_asset
+        ):
+            stack.append(asset)
+    affected_assets: Set[str] = set()
+    while stack:
+        asset = stack.pop()
+        if asset in affected_assets:
+            continue
+        affected_assets.add(asset)
+        stack.extend(parents_per_asset.get(asset, ()))
+    return affected_assets
+
+
 def recalculate_irrtree(
     root_as_set: str,
     new_members_per_asset: Dict[str, Set[str]],
@@ -110,38 +142,76 @@ def recalculate_irrtree(
     using the data from a base irrtree file data.
     Instead of calculating prefixes per as-set using the set of prefixes, we will
     calculate them summing the prefixes per as-set. This is an approximation.
+    The as-sets not affected by the changes (see find_affected_assets) keep
+    the same origin asns, their numbers are copied from the old data.
     """
     # if the new_members_per_asset is the same, we dont need to recalculate
     # naything
-    if new_members_per_asset == old_irrtree_data.as_set_tree.members_per_asset:
+    old_members_per_asset = old_irrtree_data.as_set_tree.members_per_asset
+    if (
+        new_members_per_asset is old_members_per_asset
+        or new_members_per_asset == old_members_per_asset
+    ):
         return old_irrtree_data
 
-    # Get origin asns per as-set
-    origin_ases_per_asset: Dict[str, FrozenSet[str]] = get_origin_asns_from_members(
+    # Get origin asns per as-set, as bitmasks
+    origin_mask_per_asset, origin_asn_per_bit = get_origin_asn_masks_from_members(
         root_as_set, new_members_per_asset
     )
 
-    # Combine origin asnes per asset
-    assets_per_origin_as_set: Dict[FrozenSet[str], Set[str]] = {}
-    for asset, origin_as_set in origin_ases_per_asset.items():
-        assets_per_origin_as_set.setdefault(origin_as_set, set()).add(asset)
+    # only the numbers of the affected as-sets are calculated
+    affected_assets = find_affected_assets(new_members_per_asset, old_irrtree_data)
+    affected_origin_mask_per_asset = {
+        asset: origin_mask
+        for asset, origin_mask in origin_mask_per_asset.items()
+        if asset in affected_assets
+    }
+
+    # Combine origin asnes per asset, the bitmasks are hashed as ints
+    assets_per_origin_mask: DefaultDict[int, List[str]] = defaultdict(list)
+    for asset, origin_mask in affected_origin_mask_per_asset.items():
+        assets_per_origin_mask[origin_mask].append(asset)
 
-    # calcualte prefixes per origin asns sets summing the prefixes per asn
+    # all the autnum of the tree have a bit, they are checked at once
+    number_prefixes_per_asn = old_irrtree_data.number_prefixes_per_asn
+    missing_asns = set(origin_asn_per_bit).difference(number_prefixes_per_asn)
+    if missing_asns:
+        raise Exception(f"We did not preload prefixes for {missing_asns}")
+
+    # calcualte prefixes per origin asns sets summing the prefixes per asn.
+    # The sum of each origin mask starts from the sum of its base (see
+    # get_base_origin_masks), so the sums of the subtrees are reused
+    build_order, base_mask_per_mask = get_base_origin_masks(
+        assets_per_origin_mask, affected_origin_mask_per_asset, new_members_per_asset
+    )
+    # the prefixes per asn are indexed by the bit of the asn, and summed in C
+    number_prefixes_per_bit: List[int] = [
+        number_prefixes_per_asn[asn] for asn in origin_asn_per_bit
+    ]
     number_prefixes_per_asset: Dict[str, int] = {}
     number_origin_asn_per_asset: Dict[str, int] = {}
-    for origin_as_set, assets in assets_per_origin_as_set.items():
-        prefix_counter: int = 0
-        for asn_origin in origin_as_set:
-            if asn_origin not in old_irrtree_data.number_prefixes_per_asn:
-                raise Exception(f"We did not preload prefixes for {asn_origin}")
-            prefix_counter += old_irrtree_data.number_prefixes_per_asn[asn_origin]
-        for asset in assets:
+    for asset in origin_mask_per_asset:
+        if asset not in affected_assets:
+            number_prefixes_per_asset[
+                asset
+            ] = old_irrtree_data.number_prefixes_per_asset[asset]
+            number_origin_asn_per_asset[
+                asset
+            ] = old_irrtree_data.number_origin_asn_per_asset[asset]
+    prefix_counter_per_mask: Dict[int, int] = {0: 0}
+    for origin_mask in build_order:
+        base_mask = base_mask_per_mask[origin_mask]
+        new_bits = iter_bits(origin_mask & ~base_mask)
+        prefix_counter = prefix_counter_per_mask[base_mask] + sum(
+            map(number_prefixes_per_bit.__getitem__, new_bits)
+        )
+        prefix_counter_per_mask[origin_mask] = prefix_counter
+        number_origin_asns = bin(origin_mask).count("1")
+        for asset in assets_per_origin_mask[origin_mask]:
             number_prefixes_per_asset[asset] = prefix_counter
-            number_origin_asn_per_asset[asset] = len(origin_as_set)
-
-    # The number of prefixes per asn are taken directly from their sets
-    number_prefixes_per_asn = old_irrtree_data.number_prefixes_per_asn
+            number_origin_asn_per_asset[asset] = number_origin_asns
 
+    # The number of prefixes per asn are taken directly from the old data
     asset_tree_data = ASSetTree(
         root_as_set=root_as_set, members_per_asset=new_members_per_asset
     )
@@ -172,17 +242,7 @@ def main() -> None:
     if not irrtree_file.is_file():
         raise Exception(f"{irrtree_file} is not a valid file")
 
-    filters = set()
-    if args.asset_filters:
-        invalid = set()
-        for candidate_filter in args.asset_filters.split(","):
-            candidate_filter = candidate_filter.strip()
-            if not is_as_set(candidate_filter):
-                invalid.add(candidate_filter)
-                continue
-            filters.add(candidate_filter)
-        if invalid:
-            raise Exception(f"The next are not valid as-sets for filters: {invalid}")
+    filters = parse_asset_filters(args.asset_filters)
 
     # if there is a new tree, recalculate irtree numbers based on auntum and summing values
     irr_treeoptions = build_irr_treeoptions(args)
@@ -193,10 +253,12 @@ def main() -> None:
 
     LOGGER.debug("irr_treeoptions: %s", irr_treeoptions)
 
-    # parse the file
-    metadata, original_irrtreeascii_data = parse_irrtree_return_irrasciitreedata(
-        irrtree_file.read_text()
-    )
+    # parse the file, line by line
+    with irrtree_file.open() as irrtree_lines:
+        (
+            metadata,
+            original_irrtreeascii_data,
+        ) = parse_irrtree_lines_return_irrasciitreedata(irrtree_lines)
     root_as_set = metadata.as_set
 
     #
@@ -214,7 +276,9 @@ def main() -> None:
     original_members_per_asset = (
         original_irrtreeascii_data.as_set_tree.members_per_asset
     )
-    members_per_asset = copy.deepcopy(original_members_per_asset)
+    # the filters and the tree preprocessing return new members, without
+    # modifying the ones they get, so the original members are not copied
+    members_per_asset = original_members_per_asset
 
     # Remove assets
     # filters should be removed right in the memnbers_asets
@@ -224,7 +288,7 @@ def main() -> None:
     # if search is set, modify the members.
     if irr_server_options.search:
         members_per_asset = filter_autnum(
-            root_as_set, set([irr_server_options.search]), members_per_asset
+            root_as_set, {irr_server_options.search}, members_per_asset
         )
 
     # apply tree preprocessing
@@ -234,8 +298,12 @@ def main() -> None:
         )
         LOGGER.info(f"Removed the next links to cut recursivity: {removed_links}")
 
-    # rebuild irrtree ascii data, if needed
-    if original_members_per_asset != members_per_asset:
+    # rebuild irrtree ascii data, if needed (the members are the same object
+    # if the tree was not modified)
+    if (
+        members_per_asset is not original_members_per_asset
+        and members_per_asset != original_members_per_asset
+    ):
         final_irrtreedata = recalculate_irrtree(
             root_as_set, members_per_asset, original_irrtreeascii_data
         )
@@ -243,19 +311,18 @@ def main() -> None:
         final_irrtreedata = original_irrtreeascii_data
 
     # print tree
-    irrtree_output = print_asset_tree(
+    irrtree_output = iter_asset_tree(
         final_irrtreedata, irr_server_options, irr_treeoptions
     )
 
-    # print in screen if there is not output file
-    if output_file is None:
-        print(irrtree_output)
-    else:
-        try:
-            output_file.write_text(irrtree_output)
-        except Exception as e:
-            LOGGER.error("Error writting to file", exc_info=e)
-            raise
+    # print in screen if there is not output file. The lines are written as
+    # they are drawn, the full report is never built, so drawing and writing
+    # fail together.
+    try:
+        write_asset_tree(irrtree_output, output_file)
+    except Exception as e:
+        LOGGER.error("Error drawing or writing the irrtree report", exc_info=e)
+        raise
 
 
 if __name__ == "__main__":
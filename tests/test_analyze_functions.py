@@ -0,0 +1,185 @@
+import pytest
+from pathlib import Path
+
+from irrtree.irrtree_parser import parse_irrtree
+from irrtree.analyze_functions import (
+    find_affected_prefixes_estimatino,
+    find_origin_asn_single_connected,
+    find_parents_per_member,
+    get_paths_to_autnum,
+)
+
+CURRENT_FOLDER = Path(__file__).parent.resolve()
+
+# AS-A and AS-C form a loop, AS-B and the root contain themselves
+MEMBERS_PER_ASSET = {
+    "AS-ROOT": {"AS-A", "AS-B", "AS1", "AS-ROOT"},
+    "AS-A": {"AS-C", "AS2"},
+    "AS-B": {"AS-B", "AS2", "AS3"},
+    "AS-C": {"AS-A", "AS4"},
+}
+NUM_PREFIXES_PER_AUTNUM = {"AS1": 1, "AS2": 2, "AS3": 3, "AS4": 4}
+
+
+def get_parents_per_member(root_as_set, members_per_asset):
+    parents_per_object = {}
+    find_parents_per_member(
+        root_as_set, members_per_asset, parents_per_object, set(), set()
+    )
+    return parents_per_object
+
+
+def test_get_paths_to_autnum():
+    # the loop and the self-loops are not followed, the root is not in a path
+    assert get_paths_to_autnum("AS-ROOT", MEMBERS_PER_ASSET) == {
+        "AS1": {frozenset()},
+        "AS2": {frozenset({"AS-A"}), frozenset({"AS-B"})},
+        "AS3": {frozenset({"AS-B"})},
+        "AS4": {frozenset({"AS-A", "AS-C"})},
+    }
+
+
+def test_find_parents_per_member():
+    # the links towards as-sets in the path are ignored
+    assert get_parents_per_member("AS-ROOT", MEMBERS_PER_ASSET) == {
+        "AS-A": {"AS-ROOT"},
+        "AS-B": {"AS-ROOT"},
+        "AS-C": {"AS-A"},
+        "AS1": {"AS-ROOT"},
+        "AS2": {"AS-A", "AS-B"},
+        "AS3": {"AS-B"},
+        "AS4": {"AS-C"},
+    }
+
+
+def test_find_origin_asn_single_connected():
+    parents_per_object = get_parents_per_member("AS-ROOT", MEMBERS_PER_ASSET)
+    assert find_origin_asn_single_connected(
+        "AS-ROOT", MEMBERS_PER_ASSET, parents_per_object
+    ) == {"AS-A": {"AS4"}, "AS-B": {"AS3"}, "AS-C": {"AS4"}}
+
+
+def test_find_origin_asn_single_connected_parents_cycle():
+    # AS-Y and AS-Z are parents of each other, the cycle is not followed and
+    # AS-Y is resolved from its other parent
+    members_per_asset = {
+        "AS-ROOT": {"AS-X"},
+        "AS-X": {"AS-Y"},
+        "AS-Y": {"AS-Z", "AS5"},
+        "AS-Z": {"AS-Y", "AS6"},
+    }
+    parents_per_object = {
+        "AS-X": {"AS-ROOT"},
+        "AS-Y": {"AS-X", "AS-Z"},
+        "AS-Z": {"AS-Y"},
+        "AS5": {"AS-Y"},
+        "AS6": {"AS-Z"},
+    }
+    assert find_origin_asn_single_connected(
+        "AS-ROOT", members_per_asset, parents_per_object
+    ) == {"AS-Y": {"AS5", "AS6"}, "AS-Z": {"AS6"}}
+
+
+def test_find_affected_prefixes_estimatino():
+    paths_per_autnum = get_paths_to_autnum("AS-ROOT", MEMBERS_PER_ASSET)
+    assert find_affected_prefixes_estimatino(
+        paths_per_autnum, NUM_PREFIXES_PER_AUTNUM
+    ) == {"AS-A": (4, 1), "AS-B": (3, 1), "AS-C": (4, 1)}
+
+
+def reference_paths_to_autnum(asset, members_per_asset, path, paths_per_autnum):
+    """
+    Recursive version of get_paths_to_autnum, path starts with the root
+    """
+    for member in members_per_asset.get(asset, set()):
+        if member in path:
+            continue
+        if "-" in member:
+            reference_paths_to_autnum(
+                member, members_per_asset, path + [member], paths_per_autnum
+            )
+        else:
+            paths_per_autnum.setdefault(member, set()).add(frozenset(path[1:]))
+
+
+def reference_single_links(element, root_as_set, parents_per_object, single_links):
+    """
+    Recursive version of the single links: the as-sets in all the paths from
+    element to the root
+    """
+    if element not in single_links:
+        parents = parents_per_object[element]
+        if root_as_set in parents:
+            single_links[element] = frozenset()
+        else:
+            single_links[element] = frozenset.intersection(
+                *(
+                    reference_single_links(
+                        parent, root_as_set, parents_per_object, single_links
+                    )
+                    | {parent}
+                    for parent in parents
+                )
+            )
+    return single_links[element]
+
+
+@pytest.mark.parametrize(
+    "file_path",
+    [
+        CURRENT_FOLDER / "example_file.txt",
+        CURRENT_FOLDER / "example_33763v4",
+        CURRENT_FOLDER / "example_19518v4",
+    ],
+)
+def test_files_walks(file_path: Path):
+    metadata, _, as_sets_members = parse_irrtree(file_path.read_text())
+    root_as_set = metadata.as_set
+
+    paths_per_autnum = get_paths_to_autnum(root_as_set, as_sets_members)
+    expected_paths_per_autnum = {}
+    reference_paths_to_autnum(
+        root_as_set, as_sets_members, [root_as_set], expected_paths_per_autnum
+    )
+    assert paths_per_autnum == expected_paths_per_autnum
+
+    num_prefixes_per_autnum = {autnum: len(autnum) for autnum in paths_per_autnum}
+    expected_stats = {}
+    for autnum, paths in paths_per_autnum.items():
+        for as_set in frozenset.intersection(*paths):
+            as_set_stats = expected_stats.get(as_set, (0, 0))
+            expected_stats[as_set] = (
+                as_set_stats[0] + num_prefixes_per_autnum[autnum],
+                as_set_stats[1] + 1,
+            )
+    assert (
+        find_affected_prefixes_estimatino(paths_per_autnum, num_prefixes_per_autnum)
+        == expected_stats
+    )
+
+    parents_per_object = get_parents_per_member(root_as_set, as_sets_members)
+    # every object under the root has parents, all of them links of the tree
+    under_root = set()
+    pending = [root_as_set]
+    while pending:
+        for member in as_sets_members.get(pending.pop(), set()):
+            if member not in under_root and member != root_as_set:
+                under_root.add(member)
+                pending.append(member)
+    assert set(parents_per_object) == under_root
+    for element, parents in parents_per_object.items():
+        assert all(element in as_sets_members[parent] for parent in parents)
+
+    single_links = {}
+    expected_affected_autnum_per_asset = {}
+    for autnum in paths_per_autnum:
+        for as_set in reference_single_links(
+            autnum, root_as_set, parents_per_object, single_links
+        ):
+            expected_affected_autnum_per_asset.setdefault(as_set, set()).add(autnum)
+    assert (
+        find_origin_asn_single_connected(
+            root_as_set, as_sets_members, parents_per_object
+        )
+        == expected_affected_autnum_per_asset
+    )
@@ -0,0 +1,25 @@
+import pytest
+
+from irrtree.irrtree_print import write_asset_tree
+
+
+def test_write_asset_tree(tmp_path):
+    output_file = tmp_path / "report.txt"
+    write_asset_tree(iter(["a", " +-- b"]), output_file)
+    assert output_file.read_text() == "a\n +-- b\n"
+    assert [path.name for path in tmp_path.iterdir()] == ["report.txt"]
+
+
+def test_write_asset_tree_failure(tmp_path):
+    output_file = tmp_path / "report.txt"
+    output_file.write_text("previous report\n")
+
+    def failing_lines():
+        yield "a"
+        raise ValueError("drawing failed")
+
+    with pytest.raises(ValueError):
+        write_asset_tree(failing_lines(), output_file)
+    # the previous report is kept, and the partial one removed
+    assert output_file.read_text() == "previous report\n"
+    assert [path.name for path in tmp_path.iterdir()] == ["report.txt"]
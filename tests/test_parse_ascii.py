@@ -1,6 +1,5 @@
 import pytest
-from irrtree.parse_ascii_tree import parse_ascii_tree
-import asciitree
+from irrtree.parse_ascii_tree import parse_ascii_tree, draw_ascii_tree
 from pathlib import Path
 
 EXAMPLE = """asciitree
@@ -21,13 +20,21 @@ CURRENT_FOLDER = Path(__file__).parent.resolve()
 
 def test_example():
     tree = parse_ascii_tree(EXAMPLE)
-    tr = asciitree.LeftAligned()
-    assert tr(tree).strip() == EXAMPLE.strip()
+    assert draw_ascii_tree(tree).strip() == EXAMPLE.strip()
 
 
 @pytest.mark.parametrize("file_path", [CURRENT_FOLDER / "example__ascii_tree_file.txt"])
 def test_files(file_path: Path):
     text = file_path.read_text()
     tree = parse_ascii_tree(text)
+    assert draw_ascii_tree(tree).strip() == text.strip()
+
+
+@pytest.mark.parametrize("file_path", [CURRENT_FOLDER / "example__ascii_tree_file.txt"])
+def test_same_as_asciitree(file_path: Path):
+    # asciitree is not a dependency anymore, but it is the reference
+    asciitree = pytest.importorskip("asciitree")
     tr = asciitree.LeftAligned()
-    assert tr(tree).strip() == text.strip()
+    for text in (EXAMPLE, file_path.read_text()):
+        tree = parse_ascii_tree(text)
+        assert draw_ascii_tree(tree) == tr(tree)
@@ -1,7 +1,11 @@
 import pytest
 from pathlib import Path
 import irrtree
-from irrtree.irrtree_parser import parse_irrtree, parse_irrtree_return_irrasciitreedata
+from irrtree.irrtree_parser import (
+    parse_irrtree,
+    parse_irrtree_lines,
+    parse_irrtree_return_irrasciitreedata,
+)
 from irrtree.irrtree_builder import build_irrtree_content
 from irrtree.analyze_functions import get_irr_output
 from irrtree.irrtree_print import print_asset_tree
@@ -47,6 +51,20 @@ def test_files(file_path: Path):
         assert as_count == len(irrtree_db[as_set])
 
 
+@pytest.mark.parametrize(
+    "file_path",
+    [
+        CURRENT_FOLDER / "example_file.txt",
+        CURRENT_FOLDER / "example_33763v4",
+        CURRENT_FOLDER / "example_19518v4",
+    ],
+)
+def test_parse_file_lines(file_path: Path):
+    with file_path.open() as lines:
+        from_lines = parse_irrtree_lines(lines)
+    assert from_lines == parse_irrtree(file_path.read_text())
+
+
 @pytest.mark.parametrize(
     "file_path",
     [
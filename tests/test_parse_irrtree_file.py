@@ -0,0 +1,59 @@
+from pathlib import Path
+
+from irrtree.irrtree_parser import parse_irrtree_return_irrasciitreedata
+from irrtree.process_functions import get_origin_asns_per_asset
+from irrtree.scripts.parse_irrtree_file import (
+    filter_from_graph,
+    find_affected_assets,
+    recalculate_irrtree,
+)
+
+CURRENT_FOLDER = Path(__file__).parent.resolve()
+
+
+def test_recalculate_irrtree_filter():
+    _, data = parse_irrtree_return_irrasciitreedata(
+        (CURRENT_FOLDER / "example_file.txt").read_text()
+    )
+    root_as_set = data.as_set_tree.root_as_set
+    members_per_asset = filter_from_graph(
+        root_as_set, data.as_set_tree.members_per_asset, {"AS-XMS"}
+    )
+    new_data = recalculate_irrtree(root_as_set, members_per_asset, data)
+    affected_assets = find_affected_assets(members_per_asset, data)
+
+    assert "AS-XMS" not in new_data.number_prefixes_per_asset
+    assert root_as_set in affected_assets
+    assert "AS-ROUTIT" not in affected_assets
+
+    origin_asns_per_asset = get_origin_asns_per_asset(root_as_set, members_per_asset)
+    assert set(new_data.number_prefixes_per_asset) == set(origin_asns_per_asset)
+    for asset, origin_asns in origin_asns_per_asset.items():
+        if asset in affected_assets:
+            # the affected as-sets are recalculated summing the prefixes
+            assert new_data.number_prefixes_per_asset[asset] == sum(
+                data.number_prefixes_per_asn[asn] for asn in origin_asns
+            )
+            assert new_data.number_origin_asn_per_asset[asset] == len(origin_asns)
+        else:
+            # the rest keep the numbers of the file
+            assert (
+                new_data.number_prefixes_per_asset[asset]
+                == data.number_prefixes_per_asset[asset]
+            )
+            assert (
+                new_data.number_origin_asn_per_asset[asset]
+                == data.number_origin_asn_per_asset[asset]
+            )
+    # the number in the file, the sum of the prefixes of its autnum is 492
+    assert new_data.number_prefixes_per_asset["AS-ROUTIT"] == 491
+
+
+def test_recalculate_irrtree_same_members():
+    _, data = parse_irrtree_return_irrasciitreedata(
+        (CURRENT_FOLDER / "example_file.txt").read_text()
+    )
+    root_as_set = data.as_set_tree.root_as_set
+    members_per_asset = data.as_set_tree.members_per_asset
+    assert recalculate_irrtree(root_as_set, members_per_asset, data) is data
+    assert not find_affected_assets(members_per_asset, data)
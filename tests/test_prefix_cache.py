@@ -0,0 +1,168 @@
+import asyncio
+import sys
+from datetime import datetime
+
+import irrtree.prefix_cache
+from irrtree.datamodels import IRRServerOptions, IRRAsciiTreeOptions, MembersSorting
+from irrtree.prefix_cache import load_cached_prefixes, store_prefixes
+from irrtree.process_functions import irrtree_process
+
+MEMBERS_PER_ASSET = {"AS-A": "AS-B AS1 AS-C", "AS-B": "AS2 AS3", "AS-C": "AS3 AS4"}
+HOST = "rr.ntt.net"
+PORT = 43
+PREFIXES_PER_AUTNUM = {
+    "AS1": "10.0.0.0/24 10.0.1.0/24",
+    "AS2": "10.0.1.0/24",
+    "AS3": "10.0.2.0/24",
+    "AS4": "11.0.0.0/8",
+}
+
+
+def set_time(monkeypatch, now: float) -> None:
+    monkeypatch.setattr(irrtree.prefix_cache.time, "time", lambda: now)
+
+
+def test_store_load_interned(tmp_path):
+    cache_file = tmp_path / "cache.sqlite"
+    # built at runtime, so they are not interned as literals
+    prefix = sys.intern("".join(["10.0.0.", "0/24"]))
+    store_prefixes(
+        cache_file, {"AS1": {"10.0.0.0/24", "10.0.1.0/24"}}, HOST, PORT, None, 4
+    )
+    loaded = load_cached_prefixes(cache_file, ["AS1", "AS2"], HOST, PORT, None, 4, 60)
+    assert loaded == {"AS1": {"10.0.0.0/24", "10.0.1.0/24"}}
+    assert any(loaded_prefix is prefix for loaded_prefix in loaded["AS1"])
+
+
+def test_load_expired(tmp_path, monkeypatch):
+    cache_file = tmp_path / "cache.sqlite"
+    set_time(monkeypatch, 1000)
+    store_prefixes(cache_file, {"AS1": {"10.0.0.0/24"}}, HOST, PORT, None, 4)
+    set_time(monkeypatch, 1060)
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, None, 4, 60) == {
+        "AS1": {"10.0.0.0/24"}
+    }
+    set_time(monkeypatch, 1061)
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, None, 4, 60) == {}
+
+
+def test_load_other_sources_or_afi(tmp_path):
+    cache_file = tmp_path / "cache.sqlite"
+    store_prefixes(cache_file, {"AS1": {"10.0.0.0/24"}}, HOST, PORT, "RIPE", 4)
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, "RIPE", 6, 60) == {}
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, "RADB", 4, 60) == {}
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, None, 4, 60) == {}
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, "RIPE", 4, 60) == {
+        "AS1": {"10.0.0.0/24"}
+    }
+
+
+def test_load_other_server(tmp_path):
+    cache_file = tmp_path / "cache.sqlite"
+    store_prefixes(cache_file, {"AS1": {"10.0.0.0/24"}}, HOST, PORT, None, 4)
+    # the default sources depend on the server
+    assert (
+        load_cached_prefixes(cache_file, ["AS1"], "whois.radb.net", PORT, None, 4, 60)
+        == {}
+    )
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, 4343, None, 4, 60) == {}
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, None, 4, 60) == {
+        "AS1": {"10.0.0.0/24"}
+    }
+
+
+def test_store_replaces(tmp_path):
+    cache_file = tmp_path / "cache.sqlite"
+    store_prefixes(cache_file, {"AS1": {"10.0.0.0/24"}}, HOST, PORT, None, 4)
+    store_prefixes(cache_file, {"AS1": {"11.0.0.0/8"}}, HOST, PORT, None, 4)
+    assert load_cached_prefixes(cache_file, ["AS1"], HOST, PORT, None, 4, 60) == {
+        "AS1": {"11.0.0.0/8"}
+    }
+
+
+async def run_irrtree_process(prefix_cache, queried_autnums, port=0):
+    """
+    Runs irrtree_process against a local irrd (on the port, a free one if 0),
+    adding the autnums whose prefixes are queried to queried_autnums.
+    Returns the report and the port of the irrd.
+    """
+
+    async def handle(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            query = line.decode().strip()
+            if query == "!!":
+                continue
+            if query == "!q":
+                break
+            if query.startswith("!t"):
+                writer.write(b"C\n")
+                continue
+            if query.startswith("!i"):
+                data = MEMBERS_PER_ASSET[query[2:]]
+            else:
+                queried_autnums.append(query[2:])
+                data = PREFIXES_PER_AUTNUM[query[2:]]
+            writer.write(f"A{len(data) + 1}\n{data}\nC\n".encode())
+            await writer.drain()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port)
+    port = server.sockets[0].getsockname()[1]
+    options = IRRServerOptions(
+        irr_host="127.0.0.1",
+        irr_port=port,
+        afi=4,
+        workers=2,
+        date=datetime(2020, 1, 1),
+        prefix_cache=prefix_cache,
+    )
+    tree_options = IRRAsciiTreeOptions(sorting_option=MembersSorting.by_name)
+    try:
+        lines = await irrtree_process("AS-A", options, tree_options, False, True)
+    finally:
+        server.close()
+        await server.wait_closed()
+    return "\n".join(lines), port
+
+
+def test_irrtree_process_cached_prefixes(tmp_path):
+    cache_file = tmp_path / "cache.sqlite"
+    queried_autnums = []
+    expected, port = asyncio.run(run_irrtree_process(None, queried_autnums))
+    assert sorted(queried_autnums) == ["AS1", "AS2", "AS3", "AS4"]
+
+    store_prefixes(
+        cache_file,
+        {"AS1": set(PREFIXES_PER_AUTNUM["AS1"].split()), "AS2": {"10.0.1.0/24"}},
+        "127.0.0.1",
+        port,
+        None,
+        4,
+    )
+    queried_autnums = []
+    assert asyncio.run(run_irrtree_process(cache_file, queried_autnums, port)) == (
+        expected,
+        port,
+    )
+    assert sorted(queried_autnums) == ["AS3", "AS4"]
+
+    # the queried prefixes are stored, the next run does not query any
+    queried_autnums = []
+    assert asyncio.run(run_irrtree_process(cache_file, queried_autnums, port)) == (
+        expected,
+        port,
+    )
+    assert queried_autnums == []
+
+
+def test_irrtree_process_failing_cache(tmp_path):
+    # the cache file cannot be opened, all the prefixes are queried
+    cache_file = tmp_path / "missing" / "cache.sqlite"
+    queried_autnums = []
+    expected, _ = asyncio.run(run_irrtree_process(None, queried_autnums))
+    queried_autnums = []
+    report, _ = asyncio.run(run_irrtree_process(cache_file, queried_autnums))
+    assert report == expected
+    assert sorted(queried_autnums) == ["AS1", "AS2", "AS3", "AS4"]
@@ -0,0 +1,148 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from irrtree.datamodels import IRRServerOptions
+from irrtree.query_workers import Worker, SimpleQueue
+
+OPTIONS = IRRServerOptions(irr_host="127.0.0.1", irr_port=43, afi=4, workers=1)
+MEMBERS_PER_ASSET = {f"AS-SET{n}": {f"AS{n}", f"AS{n + 100}"} for n in range(8)}
+
+
+async def run_query_many(drop_after: int):
+    """
+    Runs query_many against a local irrd that resets the first connection
+    after answering drop_after queries, with the rest of the batch unread.
+    Returns the results and the number of connections.
+    """
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        answered = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            query = line.decode().strip()
+            if query == "!!":
+                continue
+            if query.startswith("!t"):
+                writer.write(b"C\n")
+                continue
+            if len(connections) == 1 and answered == drop_after:
+                # a linger of 0 resets the connection when closing it
+                sock = writer.get_extra_info("socket")
+                sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                )
+                writer.transport.abort()
+                return
+            data = " ".join(sorted(MEMBERS_PER_ASSET[query[2:]]))
+            writer.write(f"A{len(data) + 1}\n{data}\nC\n".encode())
+            answered += 1
+            await writer.drain()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    options = IRRServerOptions(irr_host="127.0.0.1", irr_port=port, afi=4, workers=1)
+    worker = Worker(0, options, SimpleQueue())
+    await worker.initialize()
+    try:
+        results = await worker.query_many("i", list(MEMBERS_PER_ASSET))
+    finally:
+        worker.writer.close()
+        server.close()
+    return results, len(connections)
+
+
+def test_query_many_connection_reset():
+    results, connections = asyncio.run(run_query_many(drop_after=3))
+    assert results == list(MEMBERS_PER_ASSET.values())
+    assert connections == 2
+
+
+async def run_receive_payload(answer: str, data: bytes):
+    """
+    Returns the payload received for the answer, with data in the reader
+    (then an EOF), and the data left in the reader
+    """
+    worker = Worker(0, OPTIONS, SimpleQueue())
+    worker.reader = asyncio.StreamReader()
+    worker.reader.feed_data(data)
+    worker.reader.feed_eof()
+    payload = await worker.receive_payload(answer)
+    return payload, await worker.reader.read()
+
+
+@pytest.mark.parametrize(
+    "answer, data, payload, left",
+    [
+        ("A9", b"AS1 AS20\nC\n", b"AS1 AS20\n", b"C\n"),
+        # the length is not a number, the payload is read as a line
+        ("Axx", b"AS1 AS20\nC\n", b"AS1 AS20\n", b"C\n"),
+        # the length does not include the newline
+        ("A8", b"AS1 AS20\nC\n", b"AS1 AS20\n", b"C\n"),
+        # an EOF before the length, the partial payload is returned
+        ("A20", b"AS1 AS20\n", b"AS1 AS20\n", b""),
+    ],
+)
+def test_receive_payload(answer, data, payload, left):
+    assert asyncio.run(run_receive_payload(answer, data)) == (payload, left)
+
+
+async def run_get_many_consumers():
+    queue = SimpleQueue()
+    consumers = [asyncio.create_task(queue.get()) for _ in range(3)]
+    await asyncio.sleep(0)
+    queue.put_nowait("AS-SET1")
+    await asyncio.sleep(0)
+    done = [consumer for consumer in consumers if consumer.done()]
+    # only one consumer gets the item, the rest wait again
+    assert [consumer.result() for consumer in done] == ["AS-SET1"]
+    assert queue.empty()
+    queue.put_nowait("AS-SET2")
+    queue.put_nowait("AS-SET3")
+    results = await asyncio.gather(*consumers)
+    assert sorted(results) == ["AS-SET1", "AS-SET2", "AS-SET3"]
+
+
+def test_simple_queue_many_consumers():
+    asyncio.run(run_get_many_consumers())
+
+
+async def run_join():
+    queue = SimpleQueue()
+    # an empty queue is already joined
+    await asyncio.wait_for(queue.join(), 1)
+    queue.put_nowait("AS-SET1")
+    queue.put_nowait("AS-SET2")
+    join = asyncio.create_task(queue.join())
+    assert await queue.get() == "AS-SET1"
+    assert queue.get_nowait() == "AS-SET2"
+    queue.task_done()
+    await asyncio.sleep(0)
+    assert not join.done()
+    queue.task_done()
+    await asyncio.wait_for(join, 1)
+
+
+def test_simple_queue_join():
+    asyncio.run(run_join())
+
+
+async def run_task_done_too_many():
+    queue = SimpleQueue()
+    queue.put_nowait("AS-SET1")
+    assert queue.get_nowait() == "AS-SET1"
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+    queue.task_done()
+    with pytest.raises(ValueError):
+        queue.task_done()
+
+
+def test_simple_queue_task_done_too_many():
+    asyncio.run(run_task_done_too_many())